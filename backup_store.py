@@ -0,0 +1,241 @@
+"""
+家庭财务管理系统 - Excel 备份仓库
+
+功能：
+1. 按文件内容（SHA-256）寻址保存备份，内容未变化时不重复复制
+2. 文件系统支持时使用 reflink（写时复制）克隆，否则普通复制
+3. 按 最近N份 / 每小时 / 每天 / 每月 的保留策略自动清理旧备份
+4. 从任意一份备份恢复工作簿
+
+目录结构：
+    backups/
+    ├── index.json                # 备份清单（时间、来源文件、内容哈希）
+    └── objects/ab/abcdef....xlsx # 按内容哈希保存的文件，相同内容只存一份
+
+注意：备份不使用硬链接。openpyxl 保存工作簿时会原地覆盖文件，
+硬链接的备份会随原文件一起被改写。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from datetime import datetime
+
+
+# Linux FICLONE ioctl（btrfs / xfs 等支持写时复制的文件系统）
+FICLONE = 0x40049409
+
+# 默认保留策略
+DEFAULT_RETENTION = {
+    'keep_last': 5,    # 最近 N 份
+    'hourly': 24,      # 最近 24 个小时，每小时保留最新一份
+    'daily': 14,       # 最近 14 天，每天保留最新一份
+    'monthly': 12      # 最近 12 个月，每月保留最新一份
+}
+
+RETENTION_BUCKETS = [
+    ('hourly', '%Y%m%d%H'),
+    ('daily', '%Y%m%d'),
+    ('monthly', '%Y%m')
+]
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """分块计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def clone_file(src, dst):
+    """复制文件：优先 reflink 克隆（不占用额外空间），不支持时退回普通复制"""
+    try:
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return 'reflink'
+    except (ImportError, OSError):
+        shutil.copy2(src, dst)
+        return 'copy'
+
+
+def lock_file(f):
+    """阻塞直到取得已打开文件 f 的独占锁"""
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK 重试约 10 秒后放弃，继续等待持有锁的进程
+                continue
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def unlock_file(f):
+    """释放 lock_file 取得的锁"""
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class BackupStore:
+    def __init__(self, root='backups', retention=None):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.index_path = os.path.join(root, 'index.json')
+        self.lock_path = os.path.join(root, '.lock')
+        self.retention = dict(DEFAULT_RETENTION)
+        if retention:
+            self.retention.update(retention)
+
+    @contextmanager
+    def _locked(self):
+        """进程间互斥（批量同步时可能有多个进程同时写清单）
+
+        使用操作系统的文件锁：持有锁的进程退出（包括异常退出）时自动释放，
+        因此不需要判断遗留的锁，也不会抢走仍在复制大文件的进程的锁。锁文件本身保留不删除。
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.lock_path, 'a+b') as f:
+            lock_file(f)
+            try:
+                yield
+            finally:
+                unlock_file(f)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _save_index(self, entries):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def _object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256[:2], sha256 + '.xlsx')
+
+    def list_backups(self, source=None):
+        """列出备份（最新的在前）；source 为文件名时只列出该文件的备份"""
+        entries = self._load_index()
+        if source:
+            entries = [e for e in entries if e['source'] == os.path.basename(source)]
+        return sorted(entries, key=lambda e: e['time'], reverse=True)
+
+    def backup(self, path):
+        """备份文件；内容与该文件最近一次备份相同时跳过，返回新备份条目或 None"""
+        sha256 = file_sha256(path)
+        source = os.path.basename(path)
+
+        with self._locked():
+            entries = self._load_index()
+            previous = [e for e in entries if e['source'] == source]
+            if previous and max(previous, key=lambda e: e['time'])['sha256'] == sha256:
+                return None
+
+            object_path = self._object_path(sha256)
+            method = 'dedup'
+            if not os.path.exists(object_path):
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                tmp_path = object_path + '.tmp'
+                method = clone_file(path, tmp_path)
+                os.replace(tmp_path, object_path)
+
+            now = datetime.now()
+            entry = {
+                'id': f"{now.strftime('%Y%m%d_%H%M%S')}_{sha256[:8]}",
+                'time': now.isoformat(),
+                'source': source,
+                'sha256': sha256,
+                'size': os.path.getsize(path),
+                'method': method
+            }
+            entries.append(entry)
+            entries = self._apply_retention(entries)
+            self._save_index(entries)
+            self._remove_orphans(entries)
+
+        return entry
+
+    def _apply_retention(self, entries):
+        """按保留策略筛选备份条目（每个来源文件单独计算）"""
+        kept = []
+        for source in {e['source'] for e in entries}:
+            history = sorted((e for e in entries if e['source'] == source),
+                             key=lambda e: e['time'], reverse=True)
+            keep_ids = {e['id'] for e in history[:self.retention['keep_last']]}
+
+            for name, fmt in RETENTION_BUCKETS:
+                limit = self.retention[name]
+                seen = set()
+                for entry in history:
+                    bucket = datetime.fromisoformat(entry['time']).strftime(fmt)
+                    if bucket in seen:
+                        continue
+                    if len(seen) >= limit:
+                        break
+                    seen.add(bucket)
+                    keep_ids.add(entry['id'])
+
+            kept.extend(e for e in history if e['id'] in keep_ids)
+
+        return sorted(kept, key=lambda e: e['time'])
+
+    def _remove_orphans(self, entries):
+        """删除不再被任何备份条目引用的内容文件"""
+        referenced = {e['sha256'] for e in entries}
+        if not os.path.isdir(self.objects_dir):
+            return
+        for prefix in os.listdir(self.objects_dir):
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            for name in os.listdir(prefix_dir):
+                if name.endswith('.xlsx') and name[:-5] not in referenced:
+                    os.remove(os.path.join(prefix_dir, name))
+
+    def restore(self, target, backup_id=None):
+        """把备份恢复到 target（支持 id 前缀）
+
+        backup_id 为空时恢复最近一份与 target 当前内容不同的备份。
+        恢复前会先备份 target 当前内容，恢复操作本身也可以撤销。
+        """
+        entries = self.list_backups(source=target)
+        if backup_id:
+            entries = [e for e in entries if e['id'].startswith(backup_id)]
+        elif os.path.exists(target):
+            current = file_sha256(target)
+            entries = [e for e in entries if e['sha256'] != current]
+        if not entries:
+            raise FileNotFoundError(f"找不到备份: {backup_id or os.path.basename(target)}")
+        entry = entries[0]
+
+        # 先取出要恢复的内容：恢复前的备份会按保留策略清理旧备份，可能正好删掉这一份
+        tmp_path = target + '.restore.tmp'
+        clone_file(self._object_path(entry['sha256']), tmp_path)
+        try:
+            if os.path.exists(target):
+                self.backup(target)
+            os.replace(tmp_path, target)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return entry
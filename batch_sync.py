@@ -0,0 +1,160 @@
+"""
+家庭财务管理系统 - 批量同步工具（非交互）
+
+同时为多个家庭的 Excel 工作簿执行同步，适合定时任务或脚本调用：
+1. excel-to-web：每个工作簿 -> <输出目录>/<文件名>.json
+2. web-to-excel：<输出目录>/<文件名>.json -> 对应的工作簿（写入前自动备份）
+
+进度以 JSON 行输出到标准输出，结束后在标准错误输出每个文件的耗时汇总。
+
+用法示例：
+    python batch_sync.py --input "households/*.xlsx" --output-dir data --workers 4
+    python batch_sync.py --direction web-to-excel --input "households/*.xlsx" --output-dir data
+    python batch_sync.py --input "households/*.xlsx" --sheets expense,deposit --incremental
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from sync_finance_data import FinanceDataSync, SyncError
+
+
+DIRECTIONS = ('excel-to-web', 'web-to-excel')
+
+
+def sync_workbook(job):
+    """进程池任务：同步单个工作簿，返回结果字典（不抛出异常）"""
+    started = time.perf_counter()
+    result = {'file': job['excel_path'], 'data_path': job['data_path']}
+    try:
+        sync = FinanceDataSync(
+            job['excel_path'],
+            data_path=job['data_path'],
+            sheets=job['sheets'],
+            quiet=True
+        )
+        if job['direction'] == 'excel-to-web':
+            outcome = sync.excel_to_web(incremental=job['incremental'])
+        else:
+            outcome = sync.web_to_excel(incremental=job['incremental'])
+        result.update(status=outcome['status'], counts=outcome['counts'])
+    except (SyncError, ValueError, OSError) as e:
+        result.update(status='error', error=str(e))
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def emit(event, **fields):
+    """输出一行 JSON 进度"""
+    print(json.dumps(dict(event=event, **fields), ensure_ascii=False), flush=True)
+
+
+def collect_workbooks(patterns):
+    """展开输入通配符，忽略 Excel 锁文件（~$开头）并去重"""
+    paths = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            if os.path.basename(path).startswith('~$'):
+                continue
+            path = os.path.abspath(path)
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def build_jobs(args, workbooks):
+    jobs = []
+    data_paths = {}
+    for excel_path in workbooks:
+        output_dir = args.output_dir or os.path.dirname(excel_path)
+        name = os.path.splitext(os.path.basename(excel_path))[0] + '.json'
+        data_path = os.path.join(output_dir, name)
+        if data_path in data_paths:
+            raise ValueError(f"数据文件重名: {excel_path} 与 {data_paths[data_path]} 都对应 {data_path}")
+        data_paths[data_path] = excel_path
+        jobs.append({
+            'excel_path': excel_path,
+            'data_path': data_path,
+            'direction': args.direction,
+            'sheets': args.sheets,
+            'incremental': args.incremental
+        })
+    return jobs
+
+
+def print_summary(results, wall_seconds):
+    """在标准错误输出每个文件的耗时汇总"""
+    out = sys.stderr
+    print("="*70, file=out)
+    print(f"{'状态':<10}{'耗时(秒)':>10}{'记录数':>10}  文件", file=out)
+    print("="*70, file=out)
+    for result in sorted(results, key=lambda r: r['seconds'], reverse=True):
+        records = sum(result.get('counts', {}).values())
+        status = result['status']
+        print(f"{status:<10}{result['seconds']:>10.2f}{records:>10}  {result['file']}", file=out)
+        if status == 'error':
+            print(f"{'':<30}✗ {result['error']}", file=out)
+    print("="*70, file=out)
+    busy = sum(r['seconds'] for r in results)
+    failed = sum(1 for r in results if r['status'] == 'error')
+    print(f"共 {len(results)} 个文件，失败 {failed} 个；总耗时 {wall_seconds:.2f}s，"
+          f"各文件耗时合计 {busy:.2f}s", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='家庭财务管理系统 - 批量同步多个工作簿')
+    parser.add_argument('--direction', choices=DIRECTIONS, default='excel-to-web',
+                        help='同步方向（默认 excel-to-web）')
+    parser.add_argument('--input', nargs='+', required=True,
+                        help='工作簿通配符，可以有多个，如 "households/*.xlsx"')
+    parser.add_argument('--output-dir', help='JSON 数据文件目录（默认与工作簿同目录）')
+    parser.add_argument('--sheets', type=lambda value: [s.strip() for s in value.split(',') if s.strip()],
+                        help='只同步指定类型，逗号分隔：deposit,loan,tax,tfsa,education,expense')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='并发进程数（默认为 CPU 核数）')
+    parser.add_argument('--incremental', action='store_true', help='增量同步（只处理有变化的记录）')
+    args = parser.parse_args()
+
+    workbooks = collect_workbooks(args.input)
+    if not workbooks:
+        emit('error', error='没有匹配的工作簿')
+        sys.exit(1)
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    try:
+        jobs = build_jobs(args, workbooks)
+        # 提前校验数据类型，避免每个子进程都报同样的错误
+        FinanceDataSync(sheets=args.sheets, quiet=True)
+    except ValueError as e:
+        emit('error', error=str(e))
+        sys.exit(1)
+
+    emit('start', files=len(jobs), workers=args.workers, direction=args.direction)
+    started = time.perf_counter()
+    results = []
+
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(jobs)))) as pool:
+        futures = [pool.submit(sync_workbook, job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            emit('file', done=len(results), total=len(jobs), **result)
+
+    wall_seconds = time.perf_counter() - started
+    failed = sum(1 for r in results if r['status'] == 'error')
+    emit('summary', files=len(results), failed=failed, seconds=round(wall_seconds, 3))
+    print_summary(results, wall_seconds)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
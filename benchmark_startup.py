@@ -0,0 +1,101 @@
+"""
+家庭财务管理系统 - 启动耗时基准测试
+
+在全新的 Python 进程中测量：
+1. 导入 sync_finance_data / start_server_simple 的耗时
+2. 从导入开始到读出 Excel 第一条记录的耗时
+3. 子进程的峰值内存（仅 Linux / macOS）
+
+用法：
+    python benchmark_startup.py [Excel 文件路径] [--runs 5]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+IMPORT_SNIPPET = '''
+import time
+t = time.perf_counter()
+import {module}
+print(time.perf_counter() - t)
+'''
+
+FIRST_RECORD_SNIPPET = '''
+import time
+t = time.perf_counter()
+from sync_finance_data import FinanceDataSync
+sync = FinanceDataSync({excel_path!r}, quiet=True)
+next(sync.iter_excel_records(), None)
+print(time.perf_counter() - t)
+'''
+
+
+def run_snippet(code):
+    """在新进程中运行代码，返回 (耗时秒数, 峰值内存 MB)"""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss if resource else 0
+    result = subprocess.run(
+        [sys.executable, '-c', code],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    rss_mb = None
+    if resource:
+        # ru_maxrss 为所有已结束子进程中的最大值：Linux 单位 KB，macOS 单位字节
+        max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        if max_rss > before:
+            rss_mb = max_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return float(result.stdout.strip()), rss_mb
+
+
+def measure(name, code, runs):
+    timings = []
+    rss_mb = None
+    for _ in range(runs):
+        seconds, rss = run_snippet(code)
+        timings.append(seconds)
+        rss_mb = rss or rss_mb
+
+    median_ms = statistics.median(timings) * 1000
+    best_ms = min(timings) * 1000
+    rss_text = f"{rss_mb:.1f} MB" if rss_mb else "-"
+    print(f"{name:<32}{median_ms:>10.1f} ms{best_ms:>10.1f} ms{rss_text:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量同步工具和服务器的启动耗时')
+    parser.add_argument('excel_path', nargs='?', default='家庭财务管理系统.xlsx',
+                        help='用于测量首条记录读取耗时的 Excel 文件')
+    parser.add_argument('--runs', type=int, default=5, help='每项测量的重复次数')
+    args = parser.parse_args()
+
+    print("="*66)
+    print(f"{'项目':<30}{'中位数':>12}{'最快':>12}{'峰值内存':>10}")
+    print("="*66)
+
+    measure('import sync_finance_data', IMPORT_SNIPPET.format(module='sync_finance_data'), args.runs)
+    measure('import start_server_simple', IMPORT_SNIPPET.format(module='start_server_simple'), args.runs)
+
+    excel_path = os.path.abspath(args.excel_path)
+    if os.path.exists(excel_path):
+        measure('首条记录读取（含导入）', FIRST_RECORD_SNIPPET.format(excel_path=excel_path), args.runs)
+    else:
+        print(f"⚠ Excel 文件不存在，跳过首条记录测量: {excel_path}")
+
+    print("="*66)
+
+
+if __name__ == "__main__":
+    main()
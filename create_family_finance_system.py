@@ -1,4 +1,3 @@
-import pandas as pd
 from datetime import datetime
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
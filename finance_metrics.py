@@ -0,0 +1,202 @@
+"""
+家庭财务管理系统 - 运行指标
+
+三个 Web 服务器共用，/metrics 接口以 Prometheus 文本格式输出：
+1. 每个接口的请求数（按方法、状态码）、耗时直方图、响应大小直方图
+2. read_data / save_data / Excel 导入导出、网页生成、数据加载与写回的耗时直方图
+3. 各类型记录数、数据文件大小、当前数据版本、打开的推送连接数
+
+记录一次请求只需要在锁内累加几个整数，不影响请求本身的耗时；
+记录数和文件大小在抓取 /metrics 时才读取。
+"""
+
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+# 耗时直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# 响应大小直方图的桶上界（字节）
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 固定的接口路径；单条记录接口按路径模板归类，其余（静态文件、未知路径）归入 other
+ROUTES = {
+    '/': '/',
+    '/index.html': '/',
+    '/api/data': '/api/data',
+    '/api/save': '/api/save',
+    '/api/events': '/api/events',
+    '/api/summary': '/api/summary',
+    '/api/query': '/api/query',
+    '/api/export/excel': '/api/export/excel',
+    '/api/import/excel': '/api/import/excel',
+    '/api/profile': '/api/profile',
+    '/metrics': '/metrics'
+}
+RECORD_ROUTE = re.compile(r'^/api/records/\w+(/\d+)?$')
+
+
+def route_label(path):
+    """把请求路径归类为接口名（不含查询参数），避免每个 id 各占一组指标"""
+    route = ROUTES.get(path)
+    if route:
+        return route
+    match = RECORD_ROUTE.match(path)
+    if match:
+        return '/api/records/<type>/<id>' if match.group(1) else '/api/records/<type>'
+    return 'other'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values):
+    return ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """一组标签下的直方图：各桶计数（非累积）、总和、总数"""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, buckets, value):
+        self.counts[bisect_left(buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """进程内的指标登记表；各方法可在任意线程中调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = {}        # (方法, 接口, 状态码) -> 次数
+        self.latency = {}         # (方法, 接口) -> Histogram
+        self.sizes = {}           # (方法, 接口) -> Histogram
+        self.operations = {}      # 操作名 -> Histogram
+        self.failures = {}        # 操作名 -> 失败次数
+        self.streams = 0
+
+    def observe_request(self, method, path, status, seconds, size):
+        """记录一次请求；path 为不含查询参数的路径，size 为响应体字节数"""
+        route = route_label(path)
+        key = (method, route)
+        with self._lock:
+            request_key = (method, route, status)
+            self.requests[request_key] = self.requests.get(request_key, 0) + 1
+            latency = self.latency.get(key)
+            if latency is None:
+                latency = self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.sizes[key] = Histogram(SIZE_BUCKETS)
+            latency.observe(LATENCY_BUCKETS, seconds)
+            self.sizes[key].observe(SIZE_BUCKETS, size)
+
+    def observe_operation(self, name, seconds, failed=False):
+        with self._lock:
+            histogram = self.operations.get(name)
+            if histogram is None:
+                histogram = self.operations[name] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(LATENCY_BUCKETS, seconds)
+            if failed:
+                self.failures[name] = self.failures.get(name, 0) + 1
+
+    @contextmanager
+    def timed(self, name):
+        """记录代码块的耗时：with metrics.timed('save_data'): ...；抛出异常时同时计入失败次数"""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe_operation(name, time.perf_counter() - started, failed=True)
+            raise
+        self.observe_operation(name, time.perf_counter() - started)
+
+    def stream_opened(self):
+        with self._lock:
+            self.streams += 1
+
+    def stream_closed(self):
+        with self._lock:
+            self.streams -= 1
+
+    def render(self, store=None):
+        """返回 Prometheus 文本格式的全部指标（字节）；提供 store 时包含数据仓库的状态"""
+        with self._lock:
+            requests = sorted(self.requests.items())
+            latency = sorted((key, self._copy(h)) for key, h in self.latency.items())
+            sizes = sorted((key, self._copy(h)) for key, h in self.sizes.items())
+            operations = sorted((name, self._copy(h)) for name, h in self.operations.items())
+            failures = sorted(self.failures.items())
+            streams = self.streams
+
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{{{labels}}} {format_number(value)}' if labels
+                             else f'{name} {format_number(value)}')
+
+        def histogram(name, help_text, buckets, label_names, items):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, (counts, total, count) in items:
+                labels = format_labels(label_names, key if isinstance(key, tuple) else (key,))
+                cumulative = 0
+                for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{labels}}} {format_number(total)}')
+                lines.append(f'{name}_count{{{labels}}} {count}')
+
+        metric('finance_http_requests_total', 'counter', '请求数（按方法、接口、状态码）',
+               [(format_labels(('method', 'route', 'status'), key), value) for key, value in requests])
+        histogram('finance_http_request_duration_seconds', '请求处理耗时（推送连接只计到发出响应头）',
+                  LATENCY_BUCKETS, ('method', 'route'), latency)
+        histogram('finance_http_response_size_bytes', '响应体大小', SIZE_BUCKETS, ('method', 'route'), sizes)
+        histogram('finance_operation_duration_seconds',
+                  '读取、保存、Excel 导入导出、网页生成、数据加载与写回的耗时',
+                  LATENCY_BUCKETS, ('operation',), operations)
+        metric('finance_operation_failures_total', 'counter', '失败（抛出异常）的操作次数',
+               [(format_labels(('operation',), (name,)), value) for name, value in failures])
+        metric('finance_event_streams', 'gauge', '打开的变更推送连接数', [('', streams)])
+        metric('finance_process_start_time_seconds', 'gauge', '服务器启动时间（Unix 时间戳）',
+               [('', self.started)])
+
+        if store is not None:
+            stats = store.stats()
+            metric('finance_records', 'gauge', '各类型记录数',
+                   [(format_labels(('type',), (t,)), n) for t, n in stats['records'].items()])
+            metric('finance_data_file_bytes', 'gauge', '数据文件大小',
+                   [(format_labels(('file',), (f,)), n) for f, n in stats['files'].items()])
+            metric('finance_data_version', 'gauge', '当前数据版本号（服务器启动后从 1 开始）',
+                   [('', stats['version'])])
+            metric('finance_pending_writes', 'gauge', '尚未写回的修改（1 表示有）', [('', stats['dirty'])])
+
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    @staticmethod
+    def _copy(histogram):
+        return list(histogram.counts), histogram.sum, histogram.count
+
+
+# 进程内共享的指标登记表
+metrics = Metrics()
@@ -0,0 +1,376 @@
+"""
+家庭财务管理系统 - 服务器端网页生成
+
+各 Web 服务器共用：
+1. 把服务器上的数据和同步脚本注入 family_finance_web.html
+2. 缓存生成好的网页，HTML 文件和数据都没有变化时直接返回缓存的字节
+3. 提供 ETag，浏览器带 If-None-Match 重新验证时可以返回 304
+4. 生成数据变更推送（Server-Sent Events）的事件流
+"""
+
+import json
+import os
+import threading
+
+from finance_metrics import metrics
+from sync_finance_data import find_finance_data
+
+
+# 网页末尾的初始化代码；服务器模式下替换为同步脚本，不再从 localStorage 加载
+INIT_MARKER = '// 页面加载时初始化\n        loadData();'
+
+# 推送连接没有变更时发送心跳的间隔（秒），用于发现已断开的连接
+HEARTBEAT_SECONDS = 15
+
+# 注入网页的服务器同步脚本
+SERVER_SCRIPT = '''
+        // ========== 服务器同步功能 ==========
+        
+        // 当前数据版本的 ETag
+        function currentETag() {
+            return `"${serverEpoch}-${dataVersion}"`;
+        }
+        
+        // 发送单条记录的修改（只上传这一条记录），成功时应用服务器返回的变更
+        // checkVersion 为 true 时带上 If-Match，其他设备先修改过数据时服务器返回 409
+        async function sendRecordChange(method, url, record, checkVersion) {
+            try {
+                const options = {
+                    method: method,
+                    headers: {
+                        'Content-Type': 'application/json'
+                    }
+                };
+                if (record !== undefined) {
+                    options.body = JSON.stringify(record);
+                }
+                if (checkVersion) {
+                    options.headers['If-Match'] = currentETag();
+                }
+                const response = await fetch(url, options);
+                
+                if (response.status === 409) {
+                    console.warn('⚠ 数据已被其他设备修改，本次修改未保存');
+                    showToast('数据已被其他设备修改，请在刷新后重试');
+                    await refreshFromServer(true);
+                    return null;
+                }
+                
+                const result = await response.json();
+                if (result.success) {
+                    applyChange(result.change);
+                    console.log('✓ 数据已同步到服务器', new Date().toLocaleTimeString());
+                    showToast('数据已保存');
+                    return result;
+                }
+                console.error('✗ 保存失败:', result.error);
+                showToast('保存失败: ' + result.error);
+            } catch (error) {
+                console.error('✗ 同步异常:', error);
+                showToast('网络连接失败');
+            }
+            return null;
+        }
+        
+        function createRecord(type, record) {
+            return sendRecordChange('POST', `/api/records/${type}`, record);
+        }
+        
+        // 修改、删除已有记录时检查版本，避免覆盖其他设备的修改
+        function updateRecord(type, id, record) {
+            return sendRecordChange('PUT', `/api/records/${type}/${id}`, record, true);
+        }
+        
+        function deleteRecord(type, id) {
+            return sendRecordChange('DELETE', `/api/records/${type}/${id}`, undefined, true);
+        }
+        
+        // 应用服务器返回的变更 {epoch, version, ops}
+        // 版本不连续（其他设备也有修改）或服务器重启过时，重新加载全部数据
+        function applyChange(change) {
+            if (!change || (change.epoch === serverEpoch && change.version <= dataVersion)) {
+                return;
+            }
+            if (change.epoch !== serverEpoch || change.version !== dataVersion + 1) {
+                refreshFromServer(true);
+                return;
+            }
+            change.ops.forEach(op => {
+                financeData[op.type].splice(op.start, op.delete, ...op.records);
+            });
+            dataVersion = change.version;
+            renderAll();
+        }
+        
+        // 从服务器刷新数据；数据没有变化时服务器返回 304，不重新下载
+        // quiet 为 true 时（定期检查）不显示提示
+        async function refreshFromServer(quiet) {
+            try {
+                const response = await fetch('/api/data', {
+                    headers: {
+                        'If-None-Match': currentETag()
+                    }
+                });
+                if (response.status === 304) {
+                    if (!quiet) {
+                        showToast('数据已是最新');
+                    }
+                    return;
+                }
+                const data = await response.json();
+                
+                // ETag: "启动标识-版本号"
+                const tag = (response.headers.get('ETag') || '').replace(/"/g, '');
+                serverEpoch = tag.slice(0, tag.lastIndexOf('-'));
+                dataVersion = Number(tag.slice(tag.lastIndexOf('-') + 1));
+                financeData = data;
+                renderAll();
+                console.log('✓ 数据已从服务器刷新', new Date().toLocaleTimeString());
+                if (!quiet) {
+                    showToast('数据已刷新');
+                }
+                
+            } catch (error) {
+                console.error('✗ 刷新失败:', error);
+                if (!quiet) {
+                    showToast('刷新失败');
+                }
+            }
+        }
+        
+        // 显示提示信息
+        function showToast(message) {
+            const toast = document.createElement('div');
+            toast.style.cssText = `
+                position: fixed;
+                top: 20px;
+                right: 20px;
+                background: #4472C4;
+                color: white;
+                padding: 12px 24px;
+                border-radius: 8px;
+                box-shadow: 0 4px 12px rgba(0,0,0,0.15);
+                z-index: 10000;
+                animation: slideIn 0.3s ease;
+            `;
+            toast.textContent = message;
+            document.body.appendChild(toast);
+            
+            setTimeout(() => {
+                toast.style.animation = 'slideOut 0.3s ease';
+                setTimeout(() => toast.remove(), 300);
+            }, 2000);
+        }
+        
+        // 添加动画样式
+        const style = document.createElement('style');
+        style.textContent = `
+            @keyframes slideIn {
+                from { transform: translateX(100%); opacity: 0; }
+                to { transform: translateX(0); opacity: 1; }
+            }
+            @keyframes slideOut {
+                from { transform: translateX(0); opacity: 1; }
+                to { transform: translateX(100%); opacity: 0; }
+            }
+        `;
+        document.head.appendChild(style);
+        
+        // 添加刷新按钮到页面右上角
+        const refreshBtn = document.createElement('button');
+        refreshBtn.innerHTML = '🔄 刷新数据';
+        refreshBtn.style.cssText = `
+            position: fixed;
+            top: 20px;
+            right: 20px;
+            z-index: 9999;
+            background: white;
+            border: 2px solid #4472C4;
+            color: #4472C4;
+            padding: 8px 16px;
+            border-radius: 6px;
+            cursor: pointer;
+            font-size: 14px;
+            font-weight: 600;
+            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
+            transition: all 0.2s;
+        `;
+        refreshBtn.onmouseover = function() {
+            this.style.background = '#4472C4';
+            this.style.color = 'white';
+        };
+        refreshBtn.onmouseout = function() {
+            this.style.background = 'white';
+            this.style.color = '#4472C4';
+        };
+        refreshBtn.onclick = () => refreshFromServer();
+        document.body.appendChild(refreshBtn);
+        
+        // 重写原始的 addRecord 函数：只把新记录发送到服务器，
+        // 由服务器分配 id 后通过返回的变更加入数据
+        const originalAddRecord = addRecord;
+        addRecord = async function(type) {
+            const records = financeData[type];
+            const count = records.length;
+            originalAddRecord(type);
+            if (records.length > count) {
+                const record = records.pop();
+                if (!await createRecord(type, record)) {
+                    // 保存失败时保留在本页面
+                    records.push(record);
+                    renderAll();
+                }
+            }
+        }
+
+        // 重写原始的 updateDashboard 函数：仪表盘数值由服务器增量汇总（/api/summary），
+        // 不再在页面中遍历全部记录；请求进行中又有修改时，结束后再请求一次
+        const originalUpdateDashboard = updateDashboard;
+        let summaryETag = null;
+        let summaryLoading = false;
+        let summaryStale = false;
+
+        updateDashboard = async function() {
+            summaryStale = true;
+            if (summaryLoading) {
+                return;
+            }
+            summaryLoading = true;
+            while (summaryStale) {
+                summaryStale = false;
+                try {
+                    const response = await fetch('/api/summary', {
+                        headers: summaryETag ? { 'If-None-Match': summaryETag } : {}
+                    });
+                    if (response.status === 304) {
+                        continue;
+                    }
+                    const summary = await response.json();
+                    if (!summary.success) {
+                        throw new Error(summary.error);
+                    }
+                    summaryETag = response.headers.get('ETag');
+                    const totals = summary.totals;
+                    document.getElementById('total-deposit').textContent = formatMoney(totals.totalDeposit);
+                    document.getElementById('total-loan').textContent = formatMoney(totals.totalLoan);
+                    document.getElementById('total-tax').textContent = formatMoney(totals.totalTax);
+                    document.getElementById('total-tax-paid').textContent = formatMoney(totals.totalTaxPaid);
+                    document.getElementById('tfsa-balance').textContent = formatMoney(totals.tfsaBalance);
+                    document.getElementById('edu-balance').textContent = formatMoney(totals.eduBalance);
+                } catch (error) {
+                    console.error('✗ 汇总加载失败，改为在页面中计算:', error);
+                    summaryETag = null;
+                    originalUpdateDashboard();
+                }
+            }
+            summaryLoading = false;
+        }
+
+        // 订阅服务器推送的变更（Server-Sent Events）：其他设备的修改到达后立即增量应用；
+        // 断线后浏览器自动重连，并带上最后收到的版本（Last-Event-ID），服务器补发错过的变更
+        function subscribeChanges() {
+            if (!window.EventSource) {
+                // 不支持推送的浏览器：定期检查（没有变化时只有一次 304 响应）
+                setInterval(() => refreshFromServer(true), 30000);
+                return;
+            }
+            const since = encodeURIComponent(`${serverEpoch}-${dataVersion}`);
+            const events = new EventSource(`/api/events?since=${since}`);
+            events.onmessage = (event) => applyChange(JSON.parse(event.data));
+            // 服务器重启过或断线太久，无法补齐变更：重新加载一次全部数据
+            events.addEventListener('reset', () => refreshFromServer(true));
+        }
+        subscribeChanges();
+        
+        // 替换原有的 loadData 调用：直接渲染服务器数据
+        renderAll();
+        console.log('服务器模式启动 - 数据已从服务器加载');
+'''
+
+
+def build_page(html_content, payload, epoch, version):
+    """生成服务器模式的网页：替换内嵌数据（JSON 字节）并注入同步脚本（附带数据对应的版本）"""
+    # "</" 转义为 "<\\/"，避免数据中的 "</script>" 提前结束脚本
+    data_json = payload.decode('utf-8').replace('</', '<\\/')
+    start, end, _ = find_finance_data(html_content)
+    html_content = html_content[:start] + data_json + html_content[end:]
+
+    script = (f'\n        // 内嵌数据对应的服务器版本\n'
+              f'        let serverEpoch = {json.dumps(epoch)};\n'
+              f'        let dataVersion = {int(version)};\n'
+              f'{SERVER_SCRIPT}')
+    if INIT_MARKER in html_content:
+        return html_content.replace(
+            INIT_MARKER,
+            f'{script}\n        // 页面加载时初始化（数据已从服务器加载，无需调用 loadData()）\n',
+            1
+        )
+    # 找不到初始化代码时，把同步脚本加在最后一个 </script> 之前
+    index = html_content.rfind('</script>')
+    return html_content[:index] + script + html_content[index:]
+
+
+def event_stream(store, last_event_id=None, heartbeat=HEARTBEAT_SECONDS):
+    """生成推送给浏览器的事件流文本（Server-Sent Events），直到连接断开
+
+    每次变更是一条以 "启动标识-版本号" 为 id 的消息，内容为变更 JSON {epoch, version, ops}；
+    last_event_id（客户端已有的版本）之后的变更先全部补发。无法补齐时发送 reset 事件，
+    客户端重新加载全部数据。没有变更时每 heartbeat 秒发送一行注释作为心跳。
+    """
+    epoch, _, version = (last_event_id or '').rpartition('-')
+    if not epoch or not version.isdigit():
+        epoch, _, version = store.version_tag().rpartition('-')
+    version = int(version)
+
+    metrics.stream_opened()
+    try:
+        # 断线后浏览器 1 秒后重连
+        yield 'retry: 1000\n\n'
+        while True:
+            changes = store.wait_changes(epoch, version, heartbeat)
+            if changes is None:
+                tag = store.version_tag()
+                yield f'event: reset\nid: {tag}\ndata: {json.dumps({"etag": tag})}\n\n'
+                epoch, _, version = tag.rpartition('-')
+                version = int(version)
+            elif not changes:
+                yield ': ping\n\n'
+            else:
+                for change in changes:
+                    data = json.dumps(change, ensure_ascii=False, separators=(',', ':'))
+                    yield f'id: {change["epoch"]}-{change["version"]}\ndata: {data}\n\n'
+                version = changes[-1]['version']
+    finally:
+        metrics.stream_closed()
+
+
+class PageCache:
+    """缓存服务器模式的网页
+
+    以 HTML 文件的修改时间和数据版本为键，二者都没变时直接返回上次生成的字节，
+    页面加载耗时与数据量无关。
+    """
+
+    def __init__(self, html_path):
+        self.html_path = html_path
+        self._lock = threading.Lock()
+        self._key = None
+        self._body = None
+        self._etag = None
+
+    def get(self, data_version, load_data):
+        """返回 (网页字节, ETag)
+
+        load_data 只在需要重新生成时调用，返回 (数据的 JSON 字节, 启动标识, 版本号)。
+        """
+        html_mtime = os.stat(self.html_path).st_mtime_ns
+        key = (html_mtime, data_version)
+        with self._lock:
+            if key != self._key:
+                with open(self.html_path, 'r', encoding='utf-8') as f:
+                    html_content = f.read()
+                with metrics.timed('render_page'):
+                    self._body = build_page(html_content, *load_data()).encode('utf-8')
+                self._etag = f'"{html_mtime:x}-{data_version}"'
+                self._key = key
+            return self._body, self._etag
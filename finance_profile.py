@@ -0,0 +1,176 @@
+"""
+家庭财务管理系统 - 请求性能分析（可选）
+
+三个 Web 服务器共用，默认关闭，用于找出慢请求的耗时在哪里（JSON 解析、网页生成、磁盘写入……）：
+1. 环境变量 FINANCE_PROFILE=1 时分析每个请求；
+   或者从本机发出的请求带 X-Profile: 1 请求头时只分析这一个请求
+2. 用 cProfile 记录请求处理的全过程，保存为 profiles/ 目录下的 .pstats 文件，
+   每个接口只保留最近 FINANCE_PROFILE_KEEP 个（默认 20）
+3. GET /api/profile（只允许本机访问）列出最近分析过的请求和各自累计耗时最多的函数
+
+同一时间只分析一个请求（其他请求照常处理、不分析），分析期间该请求会明显变慢。
+.pstats 文件可以用 python -m pstats 或 snakeviz 等工具查看。
+"""
+
+import collections
+import cProfile
+import ipaddress
+import os
+import pstats
+import re
+import threading
+import time
+from datetime import datetime
+
+from finance_metrics import route_label
+
+
+PROFILE_ENABLED = os.environ.get('FINANCE_PROFILE', '') not in ('', '0')
+PROFILE_DIR = os.environ.get('FINANCE_PROFILE_DIR', 'profiles')
+PROFILE_KEEP = int(os.environ.get('FINANCE_PROFILE_KEEP', '20'))
+
+PROFILE_HEADER = 'X-Profile'
+TOP_FUNCTIONS = 15
+
+
+def is_local(address):
+    """客户端地址是否为本机（127.0.0.0/8、::1、映射到 IPv6 的 127.x）"""
+    try:
+        ip = ipaddress.ip_address((address or '').split('%')[0])
+    except ValueError:
+        return False
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_loopback
+
+
+def route_slug(route):
+    """接口名转换为文件名的一部分，如 /api/records/<type>/<id> -> api_records_type_id"""
+    return re.sub(r'\W+', '_', route).strip('_') or 'index'
+
+
+def function_name(key):
+    filename, line, name = key
+    if filename == '~':
+        return name
+    return f'{os.path.basename(filename)}:{line}({name})'
+
+
+class RequestProfiler:
+    """按请求分析性能；begin() / end() 可在任意线程中调用（成对在同一线程中调用）"""
+
+    def __init__(self, enabled=PROFILE_ENABLED, directory=PROFILE_DIR, keep=PROFILE_KEEP, history=50):
+        self.enabled = enabled
+        self.directory = directory
+        self.keep = keep
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self._recent = collections.deque(maxlen=history)
+
+    def wanted(self, client_address, header_value):
+        """是否分析这个请求：全局开启，或本机请求带了 X-Profile: 1"""
+        if self.enabled:
+            return True
+        return header_value not in (None, '', '0') and is_local(client_address)
+
+    def begin(self, client_address, header_value):
+        """开始分析；不需要分析或已有请求正在分析时返回 None"""
+        if not self.wanted(client_address, header_value):
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 已有其他性能分析工具在运行
+            self._busy.release()
+            return None
+        return profile, time.perf_counter(), []
+
+    def run(self, token, func, *args):
+        """在当前线程执行 func(*args)，并把耗时计入 token 对应的请求
+        （异步服务器把数据仓库操作交给线程池执行，cProfile 只记录调用 enable() 的线程）"""
+        if token is None:
+            return func(*args)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+            token[2].append(profile)
+
+    def end(self, token, method, path, status=None):
+        """结束分析并保存 .pstats 文件，返回文件名；token 为 begin() 的返回值"""
+        if token is None:
+            return None
+        profile, started, others = token
+        try:
+            profile.disable()
+            seconds = time.perf_counter() - started
+        finally:
+            self._busy.release()
+        try:
+            return self._save([profile] + others, method, route_label(path), path, status, seconds)
+        except OSError as e:
+            print(f"⚠ 性能分析结果保存失败: {e}")
+            return None
+
+    def _save(self, profiles, method, route, path, status, seconds):
+        stats = pstats.Stats(*profiles)
+        now = datetime.now()
+        suffix = f'-{method}-{route_slug(route)}.pstats'
+        filename = now.strftime('%Y%m%d-%H%M%S-%f') + suffix
+        os.makedirs(self.directory, exist_ok=True)
+        stats.dump_stats(os.path.join(self.directory, filename))
+        self._rotate(suffix)
+
+        top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+        with self._lock:
+            self._recent.appendleft({
+                'file': filename,
+                'time': now.isoformat(timespec='seconds'),
+                'method': method,
+                'route': route,
+                'path': path,
+                'status': status,
+                'seconds': round(seconds, 6),
+                'top': [{
+                    'function': function_name(key),
+                    'calls': calls,
+                    'tottime': round(tottime, 6),
+                    'cumtime': round(cumtime, 6)
+                } for key, (_, calls, tottime, cumtime, _) in top]
+            })
+        return filename
+
+    def _rotate(self, suffix):
+        """同一接口的 .pstats 文件只保留最近 keep 个（文件名以时间开头，按名称排序即按时间排序）"""
+        files = sorted(name for name in os.listdir(self.directory) if name.endswith(suffix))
+        for name in files[:max(len(files) - self.keep, 0)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def recent(self, limit=20):
+        """最近分析过的请求（最新的在前），每个包括耗时和累计耗时最多的函数"""
+        with self._lock:
+            return list(self._recent)[:limit]
+
+    def report(self, limit=20):
+        """/api/profile 的响应内容"""
+        return {
+            'success': True,
+            'enabled': self.enabled,
+            'directory': os.path.abspath(self.directory),
+            'profiles': self.recent(limit)
+        }
+
+
+# 进程内共享的性能分析器
+profiler = RequestProfiler()
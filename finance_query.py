@@ -0,0 +1,195 @@
+"""
+家庭财务管理系统 - 记录索引与查询
+
+服务器数据仓库在每次修改时维护的内存索引（每种记录类型一份）：
+1. 按日期排序的 (日期, id) 列表，日期范围查询只访问范围内的记录
+2. 按 类别 / 账户 / 银行 的哈希索引（值 -> id 集合）
+3. 基于游标的分页：游标记录上一页最后一条的 (日期, id)，数据变化后依然有效
+"""
+
+import base64
+import json
+from bisect import bisect_left, bisect_right, insort
+
+
+# 每种记录类型用于排序和范围查询的日期字段
+DATE_FIELDS = {
+    'deposit': 'date',
+    'loan': 'date',
+    'tax': 'date',
+    'tfsa': 'openDate',
+    'education': 'openDate',
+    'expense': 'date'
+}
+
+# 支持等值过滤的字段
+HASH_FIELDS = ('category', 'account', 'bank')
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def date_key(value):
+    """日期字段的排序键：取 ISO 日期部分（yyyy-mm-dd），没有日期时为空字符串"""
+    return str(value)[:10] if value else ''
+
+
+def field_key(value):
+    """哈希索引的键；空值以及列表、对象等无法按值筛选的值不建索引，返回 None"""
+    if value == '' or not isinstance(value, (str, int, float)):
+        return None
+    return value
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        date, record_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (str(date), int(record_id))
+    except (ValueError, TypeError):
+        raise ValueError(f"无效的分页游标: {cursor}")
+
+
+def query_options(params):
+    """把查询参数（如 ?type=expense&from=2024-01-01&category=餐饮&limit=20）
+    转换为 (记录类型, RecordIndex.query 的参数)；params 为 参数名 -> 字符串"""
+    try:
+        limit = int(params.get('limit') or DEFAULT_LIMIT)
+    except ValueError:
+        raise ValueError(f"limit 应为整数: {params.get('limit')}")
+    return params.get('type', ''), {
+        'date_from': params.get('from'),
+        'date_to': params.get('to'),
+        'filters': {field: params.get(field) for field in HASH_FIELDS},
+        'order': params.get('order') or 'desc',
+        'limit': limit,
+        'cursor': params.get('cursor')
+    }
+
+
+class TypeIndex:
+    """一种记录类型的索引"""
+
+    def __init__(self, date_field):
+        self.date_field = date_field
+        self.records = {}       # id -> 记录
+        self.by_date = []       # 已排序的 (日期, id)
+        self.by_field = {field: {} for field in HASH_FIELDS}  # 字段 -> 值 -> id 集合
+
+    def _key(self, record):
+        return (date_key(record.get(self.date_field)), record['id'])
+
+    def add(self, record, ordered=True):
+        """加入一条记录；ordered=False 时只追加日期键，由调用方最后统一排序"""
+        record_id = record['id']
+        self.records[record_id] = record
+        if ordered:
+            insort(self.by_date, self._key(record))
+        else:
+            self.by_date.append(self._key(record))
+        for field, values in self.by_field.items():
+            value = field_key(record.get(field))
+            if value is not None:
+                values.setdefault(value, set()).add(record_id)
+
+    def remove(self, record):
+        record_id = record['id']
+        if self.records.pop(record_id, None) is None:
+            return
+        key = self._key(record)
+        index = bisect_left(self.by_date, key)
+        if index < len(self.by_date) and self.by_date[index] == key:
+            del self.by_date[index]
+        for field, values in self.by_field.items():
+            value = field_key(record.get(field))
+            ids = values.get(value)
+            if ids is not None:
+                ids.discard(record_id)
+                if not ids:
+                    del values[value]
+
+
+class RecordIndex:
+    """全部记录类型的索引；由数据仓库在持有锁时调用 reset() / update()"""
+
+    def __init__(self):
+        self.types = {}
+
+    def reset(self, data):
+        self.types = {record_type: TypeIndex(field) for record_type, field in DATE_FIELDS.items()}
+        for record_type, records in data.items():
+            if record_type in self.types:
+                index = self.types[record_type]
+                for record in records:
+                    index.add(record, ordered=False)
+                index.by_date.sort()
+
+    def update(self, record_type, removed, added):
+        index = self.types[record_type]
+        for record in removed:
+            index.remove(record)
+        for record in added:
+            index.add(record)
+
+    def query(self, record_type, date_from=None, date_to=None, filters=None,
+              order='desc', limit=DEFAULT_LIMIT, cursor=None):
+        """查询一种记录，返回 {'records': [...], 'next_cursor': 游标或 None}
+
+        date_from / date_to 为包含边界的 yyyy-mm-dd；filters 为 {字段: 值}，
+        字段限于 类别(category) / 账户(account) / 银行(bank)。
+        """
+        if record_type not in self.types:
+            raise ValueError(f"未知的数据类型: {record_type}")
+        if order not in ('asc', 'desc'):
+            raise ValueError(f"排序方式应为 asc 或 desc: {order}")
+        filters = {k: v for k, v in (filters or {}).items() if v not in (None, '')}
+        unknown = set(filters) - set(HASH_FIELDS)
+        if unknown:
+            raise ValueError(f"不支持按字段过滤: {', '.join(sorted(unknown))}")
+        limit = max(1, min(int(limit), MAX_LIMIT))
+
+        index = self.types[record_type]
+        lower = (date_key(date_from), 0) if date_from else None
+        upper = (date_key(date_to), float('inf')) if date_to else None
+        after = decode_cursor(cursor) if cursor else None
+
+        # 过滤条件对应的 id 集合，选最小的一个作为候选
+        id_sets = [index.by_field[field].get(field_key(value), set()) for field, value in filters.items()]
+        id_sets.sort(key=len)
+
+        lo = bisect_left(index.by_date, lower) if lower else 0
+        hi = bisect_right(index.by_date, upper) if upper else len(index.by_date)
+        if after:
+            if order == 'asc':
+                lo = max(lo, bisect_right(index.by_date, after))
+            else:
+                hi = min(hi, bisect_left(index.by_date, after))
+
+        if id_sets and len(id_sets[0]) < hi - lo:
+            # 过滤条件比日期范围更有选择性：从哈希索引取候选，排序后截取日期范围
+            candidates = sorted(index._key(index.records[record_id]) for record_id in id_sets[0])
+            end = len(index.by_date)
+            start = bisect_left(candidates, index.by_date[lo]) if lo < end else len(candidates)
+            stop = bisect_left(candidates, index.by_date[hi]) if hi < end else len(candidates)
+            positions = range(start, stop) if order == 'asc' else range(stop - 1, start - 1, -1)
+            scan = (candidates[position] for position in positions)
+        else:
+            positions = range(lo, hi) if order == 'asc' else range(hi - 1, lo - 1, -1)
+            scan = (index.by_date[position] for position in positions)
+
+        # 按顺序检查其余过滤条件，多取一条用于判断是否还有下一页
+        keys = []
+        for key in scan:
+            if all(key[1] in ids for ids in id_sets):
+                keys.append(key)
+                if len(keys) > limit:
+                    break
+
+        page = keys[:limit]
+        return {
+            'records': [index.records[record_id] for _, record_id in page],
+            'next_cursor': encode_cursor(page[-1]) if len(keys) > limit else None
+        }
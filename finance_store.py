@@ -0,0 +1,1120 @@
+"""
+家庭财务管理系统 - 服务器数据仓库
+
+各 Web 服务器共用：
+1. 启动后只加载一次数据，之后读请求直接使用内存中的数据
+2. 写请求只修改内存，由后台线程合并短时间内的多次修改后持久化
+3. 每次修改都表示为 splice 操作 {type, start, delete, records}，
+   整体保存时只比较出实际变化的部分
+4. 其他进程（监视模式、批量同步）改写数据文件后自动重新加载；此时还有未写回的修改时，
+   按 id 把这些修改合并到新数据上再写回，不覆盖其他进程写入的内容
+5. 每条记录有服务器分配的整数 id，支持按 id 新增、修改、删除单条记录
+6. 数据版本单调递增，可用作 ETag；修改时可以指定 If-Match，版本不一致时拒绝（乐观并发）
+7. 每次修改同步更新内存索引（见 finance_query.py），支持按日期范围、类别、账户、银行分页查询
+8. 每次修改同步更新仪表盘汇总（见 finance_summary.py），读取汇总不需要遍历记录
+9. 最近的变更保存在环形缓冲区中，推送接口可以等待新变更，并让断线重连的客户端补齐错过的变更
+10. 加载和写回的耗时计入运行指标（见 finance_metrics.py），stats() 返回记录数和数据文件大小
+
+存储方式（storage 参数）：
+- json：每次写回都原子重写 finance_data.json（临时文件 + fsync + 替换）
+- journal：修改追加到 finance_data.journal.jsonl，日志超过阈值或定期压缩为
+  finance_data.json 快照；启动时加载快照并重放日志。每次保存的写入量与修改量成正比
+- sqlite：数据保存在 finance_data.sqlite3（WAL 模式，每种记录一张带索引的表），
+  每次保存只删除 / 插入变化的行；可用 python finance_store.py migrate 从 JSON 文件迁移
+"""
+
+import argparse
+import collections
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from finance_metrics import metrics
+from finance_query import HASH_FIELDS, RecordIndex
+from finance_summary import FinanceSummary
+from sync_finance_data import write_bytes_atomic
+
+
+RECORD_TYPES = ('deposit', 'loan', 'tax', 'tfsa', 'education', 'expense')
+ENCODE_CHUNK = 2000  # 序列化时每段的记录数
+
+
+class VersionConflict(Exception):
+    """If-Match 指定的版本与当前版本不一致（数据已被其他设备修改）"""
+
+    def __init__(self, etag):
+        super().__init__(f"数据已被其他设备修改，当前版本 {etag}")
+        self.etag = etag
+
+
+class CorruptDataFile(Exception):
+    """数据文件存在但无法解析（例如手工编辑后多了一个逗号）"""
+
+    def __init__(self, path, error):
+        super().__init__(f"数据文件 {path} 无法解析: {error}")
+        self.path = path
+
+
+def etag_matches(header, etag):
+    """判断 If-Match / If-None-Match 请求头是否命中当前 ETag"""
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in header.split(',')]
+    return etag in candidates or f'W/{etag}' in candidates
+
+
+def empty_data():
+    return {record_type: [] for record_type in RECORD_TYPES}
+
+
+def normalize_data(data):
+    """只保留六种记录类型，缺少的类型补为空列表"""
+    if not isinstance(data, dict):
+        raise ValueError("数据格式错误：应为 JSON 对象")
+    normalized = {}
+    for record_type in RECORD_TYPES:
+        records = data.get(record_type) or []
+        if not isinstance(records, list):
+            raise ValueError(f"数据格式错误：{record_type} 应为数组")
+        normalized[record_type] = records
+    return normalized
+
+
+def file_signature(path):
+    """文件状态签名（修改时间、大小、inode），文件不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size, stat.st_ino]
+
+
+def modified_at(paths):
+    """几个文件中最晚的修改时间（纳秒），都不存在时返回 0"""
+    signatures = [file_signature(path) for path in paths]
+    return max((signature[0] for signature in signatures if signature), default=0)
+
+
+def diff_records(record_type, old, new):
+    """比较同一类型的新旧记录列表，返回覆盖全部差异的一个 splice 操作（无变化时返回 None）"""
+    limit = min(len(old), len(new))
+    start = 0
+    while start < limit and old[start] == new[start]:
+        start += 1
+    end = 0
+    while end < limit - start and old[-1 - end] == new[-1 - end]:
+        end += 1
+    if start == len(old) == len(new):
+        return None
+    return {
+        'type': record_type,
+        'start': start,
+        'delete': len(old) - start - end,
+        'records': new[start:len(new) - end]
+    }
+
+
+def diff_data(old, new):
+    """比较新旧数据，返回 splice 操作列表"""
+    ops = []
+    for record_type in RECORD_TYPES:
+        op = diff_records(record_type, old[record_type], new[record_type])
+        if op:
+            ops.append(op)
+    return ops
+
+
+def apply_ops(data, ops):
+    """把 splice 操作应用到数据上（原地修改）"""
+    for op in ops:
+        records = data[op['type']]
+        records[op['start']:op['start'] + op['delete']] = op['records']
+
+
+def valid_id(record_id):
+    """记录 id 应为正整数（布尔值不算）"""
+    return type(record_id) is int and record_id > 0
+
+
+def comparable_value(value):
+    """字段值的比较形式：数字和数字文本统一为浮点数，文本去掉首尾空白"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            return float(text)
+        except ValueError:
+            return text
+    return value
+
+
+def content_key(record):
+    """记录内容（不含 id）的比较键，与这条记录经过一次 Excel 导出、导入后的比较键相同
+
+    导入时空单元格读为 None（是否列读为 False、金额列读为 0.0），网页输入的数字文本读为数字，
+    因此空值（None、空文本、False、0）不参与比较，数字和数字文本按数值比较。
+    """
+    content = {}
+    for field, value in record.items():
+        if field == 'id':
+            continue
+        value = comparable_value(value)
+        if value is None or value == '' or value is False or value == 0:
+            continue
+        content[field] = value
+    return json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def encode_data(data):
+    """紧凑 JSON 字节，与 json.dumps 的结果相同
+
+    记录列表按 ENCODE_CHUNK 分段序列化：单次 json.dumps 在整个调用期间持有 GIL，
+    大数据量时会让其他线程（包括异步服务器的事件循环）停顿数百毫秒。
+    """
+    def dumps(value):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    if not isinstance(data, dict):
+        return dumps(data)
+    parts = [b'{']
+    for key, value in data.items():
+        if len(parts) > 1:
+            parts.append(b',')
+        parts += [dumps(key), b':']
+        if isinstance(value, list) and len(value) > ENCODE_CHUNK:
+            parts.append(b'[')
+            for i in range(0, len(value), ENCODE_CHUNK):
+                parts += [b',' if i else b'', dumps(value[i:i + ENCODE_CHUNK])[1:-1]]
+            parts.append(b']')
+        else:
+            parts.append(dumps(value))
+    parts.append(b'}')
+    return b''.join(parts)
+
+
+class SnapshotBackend:
+    """整文件存储：每次写回都原子重写数据文件"""
+
+    wants_ops = False
+    # 加载的数据尚未完整写入存储（需要尽快写出完整快照）
+    stale = False
+
+    def __init__(self, path):
+        self.path = path
+        self.signature = None
+        # 无法解析的数据文件的签名：文件没有再变化时不重复解析，写回前先改名保留
+        self.rejected = None
+
+    def load(self):
+        """读取数据；文件不存在时返回 None，无法解析时抛出 CorruptDataFile"""
+        signature = file_signature(self.path)
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = normalize_data(json.load(f))
+        except FileNotFoundError:
+            self.signature = None
+            return None
+        except ValueError as e:
+            self.rejected = signature
+            raise CorruptDataFile(self.path, e)
+        self.signature = signature
+        self.rejected = None
+        return data
+
+    def changed_externally(self):
+        signature = file_signature(self.path)
+        return signature != self.signature and signature != self.rejected
+
+    def wants_snapshot(self, force=False):
+        return True
+
+    def persist(self, ops, snapshot):
+        self._set_aside_rejected()
+        write_bytes_atomic(self.path, snapshot)
+        self.signature = file_signature(self.path)
+
+    def set_aside(self):
+        """把无法解析的数据文件改名为 <文件名>.corrupt-<时间>，返回新文件名"""
+        corrupt_path = f"{self.path}.corrupt-{time.strftime('%Y%m%d-%H%M%S')}"
+        os.replace(self.path, corrupt_path)
+        self.signature = None
+        self.rejected = None
+        return corrupt_path
+
+    def _set_aside_rejected(self):
+        """数据文件仍是之前无法解析的内容时，先改名保留，不直接覆盖"""
+        if self.rejected is not None and file_signature(self.path) == self.rejected:
+            print(f"⚠ 数据文件 {self.path} 无法解析，已改名保存为 {self.set_aside()}")
+        self.rejected = None
+
+    def files(self):
+        """存储使用的文件路径（用于统计数据文件大小）"""
+        return [self.path]
+
+    def close(self):
+        pass
+
+
+class JournalBackend(SnapshotBackend):
+    """快照 + 追加日志
+
+    日志第一行记录对应快照文件的签名；快照被其他进程替换（或压缩时在重置日志前崩溃）
+    会导致签名不一致，此时日志中的修改已经过时或已包含在快照中，加载时直接丢弃。
+    不完整的行（追加时崩溃）及其后的内容被忽略。
+    重放了日志时，加载后立即压缩为新快照。
+    """
+
+    wants_ops = True
+
+    def __init__(self, path, max_log_bytes=1024 * 1024, compact_interval=300):
+        super().__init__(path)
+        self.log_path = os.path.splitext(path)[0] + '.journal.jsonl'
+        self.max_log_bytes = max_log_bytes
+        self.compact_interval = compact_interval
+        self.log_size = 0
+        self.entries = 0
+        self.compacted_at = time.monotonic()
+        self._log = None
+
+    def load(self):
+        data = super().load()
+        if data is None:
+            return None
+        replayed = self.replay(data)
+        if replayed:
+            print(f"✓ 已从日志恢复 {replayed} 次修改")
+            super().persist(None, encode_data(data))
+        self._open_log(reset=True)
+        return data
+
+    def replay(self, data):
+        """把日志中基于当前快照（load 时的签名）的修改应用到 data 上，返回重放的次数"""
+        replayed = 0
+        try:
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline() or 'null')
+                if header and header.get('snapshot') == self.signature:
+                    for line in f:
+                        try:
+                            apply_ops(data, json.loads(line)['ops'])
+                        except (ValueError, KeyError, TypeError, IndexError):
+                            break
+                        replayed += 1
+        except (OSError, ValueError):
+            pass
+        return replayed
+
+    def _open_log(self, reset):
+        """打开日志文件追加；reset 时以当前快照签名重新开始一份空日志"""
+        if self._log:
+            self._log.close()
+        if reset:
+            header = json.dumps({'snapshot': self.signature}) + '\n'
+            write_bytes_atomic(self.log_path, header.encode('utf-8'))
+            self.entries = 0
+            self.compacted_at = time.monotonic()
+        self._log = open(self.log_path, 'ab')
+        self.log_size = self._log.tell()
+
+    def wants_snapshot(self, force=False):
+        """日志中有修改，且超过大小阈值、到了压缩周期或 force 时需要压缩；
+        快照文件无法解析时也需要（日志只能在完好的快照上重放）"""
+        if self.rejected is not None and file_signature(self.path) == self.rejected:
+            return True
+        if not self.entries:
+            return False
+        return (force or self.log_size >= self.max_log_bytes
+                or time.monotonic() - self.compacted_at >= self.compact_interval)
+
+    def persist(self, ops, snapshot):
+        if snapshot is not None:
+            # 压缩：先原子写入新快照，再以新快照签名重置日志
+            super().persist(ops, snapshot)
+            self._open_log(reset=True)
+            return
+        if not ops:
+            return
+        line = json.dumps({'ops': ops}, ensure_ascii=False, separators=(',', ':')) + '\n'
+        self._log.write(line.encode('utf-8'))
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self.log_size = self._log.tell()
+        self.entries += 1
+
+    def set_aside(self):
+        """快照无法解析时，基于它的日志也一起改名保留"""
+        corrupt_path = super().set_aside()
+        if self._log is None and os.path.exists(self.log_path):
+            os.replace(self.log_path, corrupt_path + '.journal.jsonl')
+        return corrupt_path
+
+    def files(self):
+        return [self.path, self.log_path]
+
+    def close(self):
+        if self._log:
+            self._log.close()
+            self._log = None
+
+
+class SqliteBackend(SnapshotBackend):
+    """SQLite 数据库（WAL 模式），每种记录类型一张表
+
+    列来自 FinanceDataSync.field_mapping，另有 id（主键）、seq（列表中的顺序）和
+    extra（列中放不下的字段，如布尔值、空值、映射之外的字段，JSON 文本）；
+    日期、类别、账户、银行列带索引，可以直接用 SQL 查询。
+    每次保存只在一个事务中删除 / 插入变化的行。
+
+    finance_data.json 被其他进程改写（监视模式、批量同步）或首次启动时，
+    把 JSON 文件的内容导入数据库；数据库本身不会写回 JSON 文件，
+    其他进程通过 read_current_data() 读取数据库中的当前数据。
+    """
+
+    wants_ops = True
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.db_path = os.path.splitext(path)[0] + '.sqlite3'
+        self.columns = {}
+        # 每种类型各行的 seq，顺序与内存中的记录列表一致
+        self.seqs = {record_type: [] for record_type in RECORD_TYPES}
+        self.data_version = None
+        self._db = None
+        self._db_lock = threading.Lock()
+
+    def _connect(self):
+        if self._db is not None:
+            return
+        from sync_finance_data import FinanceDataSync
+        field_mapping = FinanceDataSync(quiet=True).field_mapping
+
+        db = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=FULL')
+        db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        for record_type in RECORD_TYPES:
+            fields = [field for field in field_mapping[record_type].values()
+                      if field not in ('id', 'seq', 'extra')]
+            columns = ', '.join(f'"{field}"' for field in fields)
+            db.execute(f'CREATE TABLE IF NOT EXISTS "{record_type}" '
+                       f'(id INTEGER PRIMARY KEY, seq REAL NOT NULL, {columns}, extra TEXT)')
+            db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{record_type}_seq" ON "{record_type}"(seq)')
+            for field in ('date', 'openDate', 'category', 'account', 'bank'):
+                if field in fields:
+                    db.execute(f'CREATE INDEX IF NOT EXISTS "{record_type}_{field}" '
+                               f'ON "{record_type}"("{field}")')
+            # 以数据库中实际的列为准（字段映射以后增加的字段放在 extra 中）
+            existing = [row[1] for row in db.execute(f'PRAGMA table_info("{record_type}")')]
+            self.columns[record_type] = [c for c in existing if c not in ('id', 'seq', 'extra')]
+        self._db = db
+
+    def _meta(self, key):
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def load(self):
+        with self._db_lock:
+            self._connect()
+            self.data_version = self._db.execute('PRAGMA data_version').fetchone()[0]
+            signature = file_signature(self.path)
+            if signature is not None and json.dumps(signature) != self._meta('json_signature'):
+                try:
+                    data = super().load()
+                except CorruptDataFile as e:
+                    # 不导入，继续使用数据库中的数据（数据库不会写回 JSON 文件）
+                    print(f"⚠ {e}，未导入")
+                    data = None
+                if data is not None:
+                    # 需要写出完整快照（并记录 JSON 文件签名）后导入才算完成
+                    self.stale = True
+                    print(f"✓ 从 {self.path} 导入数据到 {self.db_path}")
+                    return data
+            self.signature = signature
+            data = {}
+            for record_type in RECORD_TYPES:
+                cursor = self._db.execute(f'SELECT * FROM "{record_type}" ORDER BY seq')
+                names = [column[0] for column in cursor.description][2:-1]
+                extras = {}
+                records = []
+                seqs = []
+                for row in cursor:
+                    records.append(self._record(names, row, extras))
+                    seqs.append(row[1])
+                data[record_type] = records
+                self.seqs[record_type] = seqs
+            return data
+
+    def imported_current(self):
+        """数据库导入的是否正是当前的 JSON 文件（此后的修改只保存在数据库中）"""
+        signature = file_signature(self.path)
+        with self._db_lock:
+            self._connect()
+            return signature is not None and json.dumps(signature) == self._meta('json_signature')
+
+    def changed_externally(self):
+        """其他连接提交了修改，或 JSON 文件被改写"""
+        with self._db_lock:
+            if self._db is None:
+                return False
+            data_version = self._db.execute('PRAGMA data_version').fetchone()[0]
+        return data_version != self.data_version or file_signature(self.path) != self.signature
+
+    def wants_snapshot(self, force=False):
+        # 数据库不需要压缩；只有刚从 JSON 导入时需要写出完整数据
+        return self.stale
+
+    def persist(self, ops, snapshot):
+        with self._db_lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                if snapshot is not None:
+                    self._write_all(json.loads(snapshot))
+                    self._db.execute("INSERT OR REPLACE INTO meta VALUES ('json_signature', ?)",
+                                     (json.dumps(self.signature),))
+                else:
+                    for op in ops:
+                        self._splice(op)
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            if snapshot is not None:
+                self.stale = False
+
+    def _record(self, names, row, extras):
+        """数据库行 -> 记录（跳过空列，合并 extra）
+
+        extras 缓存已解析的 extra 文本：许多行的 extra 相同（例如只有一个布尔字段），
+        记录不会被原地修改，可以共用解析结果。
+        """
+        record = {name: value for name, value in zip(names, row[2:-1]) if value is not None}
+        extra = row[-1]
+        if extra:
+            parsed = extras.get(extra)
+            if parsed is None:
+                parsed = extras[extra] = json.loads(extra)
+            record.update(parsed)
+        record['id'] = row[0]
+        return record
+
+    def _row(self, record_type, record, seq):
+        """记录 -> 数据库行；列中只放字符串和数字，其他值放在 extra 中，读出时保持原样"""
+        columns = self.columns[record_type]
+        values = [record['id'], seq]
+        for column in columns:
+            value = record.get(column)
+            values.append(value if self._storable(value) else None)
+        extra = {key: value for key, value in record.items()
+                 if key != 'id' and not (key in columns and self._storable(value))}
+        values.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+        return values
+
+    @staticmethod
+    def _storable(value):
+        if type(value) is int:
+            return -2 ** 63 <= value < 2 ** 63
+        return type(value) in (str, float)
+
+    def _insert_sql(self, record_type):
+        placeholders = ', '.join('?' * (len(self.columns[record_type]) + 3))
+        return f'INSERT INTO "{record_type}" VALUES ({placeholders})'
+
+    def _write_all(self, data):
+        for record_type in RECORD_TYPES:
+            records = data[record_type]
+            seqs = [float(index + 1) for index in range(len(records))]
+            self._db.execute(f'DELETE FROM "{record_type}"')
+            self._db.executemany(self._insert_sql(record_type),
+                                 [self._row(record_type, r, s) for r, s in zip(records, seqs)])
+            self.seqs[record_type] = seqs
+
+    def _splice(self, op):
+        record_type = op['type']
+        start = op['start']
+        end = start + op['delete']
+        records = op['records']
+        new_seqs = self._between(record_type, start, end, len(records))
+        seqs = self.seqs[record_type]
+        self._db.executemany(f'DELETE FROM "{record_type}" WHERE seq = ?',
+                             [(seq,) for seq in seqs[start:end]])
+        self._db.executemany(self._insert_sql(record_type),
+                             [self._row(record_type, r, s) for r, s in zip(records, new_seqs)])
+        seqs[start:end] = new_seqs
+
+    def _between(self, record_type, start, end, count):
+        """为插入到 start 之前、end 之后的 count 条记录分配 seq；间隔不够时先重新编号"""
+        seqs = self.seqs[record_type]
+        left = seqs[start - 1] if start else 0.0
+        if end >= len(seqs):
+            return [left + index + 1 for index in range(count)]
+        step = (seqs[end] - left) / (count + 1)
+        if count and step < 1e-9:
+            self._renumber(record_type)
+            return self._between(record_type, start, end, count)
+        return [left + step * (index + 1) for index in range(count)]
+
+    def _renumber(self, record_type):
+        """把 seq 重新编号为 1, 2, 3, ...（先改为负数，避免与唯一索引冲突）"""
+        seqs = self.seqs[record_type]
+        self._db.executemany(f'UPDATE "{record_type}" SET seq = ? WHERE seq = ?',
+                             [(-(index + 1.0), seq) for index, seq in enumerate(seqs)])
+        self._db.execute(f'UPDATE "{record_type}" SET seq = -seq')
+        self.seqs[record_type] = [float(index + 1) for index in range(len(seqs))]
+
+    def files(self):
+        return [self.db_path, self.db_path + '-wal']
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+BACKENDS = {
+    'json': SnapshotBackend,
+    'journal': JournalBackend,
+    'sqlite': SqliteBackend
+}
+
+
+def read_current_data(path):
+    """读取服务器的当前数据（只读，供同步工具、批量同步等其他进程使用）
+
+    日志和 SQLite 存储方式下，服务器的修改先保存在日志 / 数据库中，数据文件不一定是最新的：
+    日志基于当前数据文件时重放日志；数据库导入的正是当前数据文件（或数据文件不存在）时读取数据库；
+    两者都适用时（切换过存储方式）以较新的一个为准。
+    数据文件和数据库都不存在时返回 None，数据文件无法解析时抛出 CorruptDataFile。
+    """
+    journal = JournalBackend(path)
+    data = SnapshotBackend.load(journal)
+    database = SqliteBackend(path)
+    if modified_at(database.files()) > modified_at([journal.log_path]):
+        try:
+            if data is None or database.imported_current():
+                return database.load()
+        finally:
+            database.close()
+    if data is not None:
+        journal.replay(data)
+    return data
+
+
+class FinanceStore:
+    """内存中的权威数据 + 后台持久化
+
+    get() 返回的数据由仓库持有，调用方不要修改；修改请通过 replace() / create() /
+    update() / delete()。修改方法返回本次变更 {epoch, version, ops}（没有变化时返回 None），
+    指定 if_match 且版本不一致时抛出 VersionConflict。
+    """
+
+    def __init__(self, path='finance_data.json', storage='json', flush_delay=0.5, history=1000):
+        if storage not in BACKENDS:
+            raise ValueError(f"未知的存储方式: {storage}（可选 {', '.join(BACKENDS)}）")
+        self.path = path
+        self.storage = storage
+        self.backend = BACKENDS[storage](path)
+        self.flush_delay = flush_delay
+        # 服务器每次启动的标识，与 version 一起区分不同进程给出的版本号
+        self.epoch = f'{time.time_ns():x}'
+        self.version = 0
+        self._next_id = 1
+        self._data = None
+        self._encoded = None
+        self._pending = []
+        # 上次写回之后的修改 [(splice 操作, 被替换的记录)]，用于还原出数据文件中的内容
+        self._unflushed = []
+        self._snapshot_pending = False
+        self._dirty = False
+        self._flushing = False
+        self._closed = False
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._writer = None
+        # 最近 history 次变更，以及等待新变更的推送连接
+        self._changes = collections.deque(maxlen=history)
+        self._changed = threading.Condition(self._lock)
+        # 观察者在持有锁时收到 reset(data) 和 update(类型, 删除的记录, 新增的记录)
+        self.index = RecordIndex()
+        self.summary = FinanceSummary()
+        self._observers = [self.index, self.summary]
+
+    # ---------- 加载 ----------
+
+    def _ensure_loaded(self):
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._load()
+                    self._writer = threading.Thread(target=self._write_behind, name='finance-store-writer',
+                                                    daemon=True)
+                    self._writer.start()
+
+    def _load(self):
+        """从存储加载；数据不存在时使用空数据，并尽快写出一份完整快照
+
+        启动时数据文件无法解析：改名保留后以空数据启动，不覆盖原文件；
+        重新加载时无法解析（或文件被删除）：继续使用内存中的数据。
+        """
+        try:
+            with metrics.timed('store_load'):
+                data = self.backend.load()
+        except CorruptDataFile as e:
+            if self._data is not None:
+                print(f"⚠ {e}，继续使用内存中的数据")
+                return
+            print(f"⚠ {e}，已改名保存为 {self.backend.set_aside()}，以空数据启动")
+            data = None
+        if self._data is None:
+            self._data = data or empty_data()
+            ids_assigned = self._assign_ids(self._data, empty_data())
+            self.version += 1
+            for observer in self._observers:
+                observer.reset(self._data)
+        else:
+            # 重新加载（其他进程改写了数据文件）：沿用内容相同的记录的 id，按差异更新
+            if data is None:
+                print(f"⚠ 数据文件 {self.path} 已被删除，将重新写出内存中的数据")
+                self._snapshot_pending = True
+                self._mark_dirty()
+                return
+            ids_assigned = self._assign_ids(data, self._data)
+            self._apply(diff_data(self._data, data), persist=False)
+        self._encoded = None
+        if data is None or ids_assigned or self.backend.stale:
+            # 新分配的 id 需要写回，重启后 id 保持不变
+            self._snapshot_pending = True
+            self._mark_dirty()
+
+    def _new_id(self):
+        record_id = self._next_id
+        self._next_id += 1
+        return record_id
+
+    def _assign_ids(self, data, previous):
+        """给没有 id（或 id 重复）的记录分配 id，返回是否有分配
+
+        与 previous 中内容相同的记录沿用原来的 id，例如从 Excel 重新导入的数据。
+        接受数据中已有的 id 时，之后分配的 id 从其中最大的一个之后开始，不会重复。
+        """
+        for record_type in RECORD_TYPES:
+            for record in data[record_type]:
+                if not isinstance(record, dict):
+                    raise ValueError(f"数据格式错误：{record_type} 的记录应为 JSON 对象")
+                if valid_id(record.get('id')) and record['id'] >= self._next_id:
+                    self._next_id = record['id'] + 1
+
+        assigned = False
+        for record_type in RECORD_TYPES:
+            records = data[record_type]
+            seen = set()
+            missing = []
+            for index, record in enumerate(records):
+                record_id = record.get('id')
+                if valid_id(record_id) and record_id not in seen:
+                    seen.add(record_id)
+                else:
+                    missing.append(index)
+            if not missing:
+                continue
+
+            reusable = {}
+            for record in previous[record_type]:
+                if record['id'] not in seen:
+                    reusable.setdefault(content_key(record), []).append(record['id'])
+            for index in missing:
+                ids = reusable.get(content_key(records[index]))
+                record_id = ids.pop(0) if ids else self._new_id()
+                records[index] = dict(records[index], id=record_id)
+            assigned = True
+        return assigned
+
+    def _check_external(self):
+        """数据文件被其他进程改写时重新加载（本进程正在写回时除外）"""
+        if self._flushing or not self.backend.changed_externally():
+            return
+        with self._lock:
+            if not self._flushing and self.backend.changed_externally():
+                self._reload()
+
+    def _reload(self):
+        """重新加载被其他进程改写的数据（需持有锁）；有未写回的修改时合并后再写回"""
+        if not self._unflushed:
+            self._load()
+            return
+        try:
+            data = self.backend.load()
+        except CorruptDataFile as e:
+            print(f"⚠ {e}，继续使用内存中的数据")
+            return
+        if data is None:
+            print(f"⚠ 数据文件 {self.path} 已被删除，将重新写出内存中的数据")
+            self._snapshot_pending = True
+            self._mark_dirty()
+            return
+
+        # 还原出上次写回时的数据，按 id 找出本地的新增、修改、删除
+        base = {record_type: list(records) for record_type, records in self._data.items()}
+        for op, removed in reversed(self._unflushed):
+            base[op['type']][op['start']:op['start'] + len(op['records'])] = removed
+        self._assign_ids(data, base)
+        merged = {record_type: self._rebase(base[record_type], self._data[record_type], data[record_type])
+                  for record_type in RECORD_TYPES}
+        print(f"⚠ 数据文件已被其他程序修改，已合并本地尚未写回的 {len(self._unflushed)} 处修改")
+
+        self._apply(diff_data(self._data, merged), persist=False)
+        # 之后的写回以新数据为基础，写出完整快照
+        self._unflushed = [(op, data[op['type']][op['start']:op['start'] + op['delete']])
+                           for op in diff_data(data, merged)]
+        self._pending = []
+        self._encoded = None
+        self._snapshot_pending = True
+        self._mark_dirty()
+
+    def _rebase(self, base, current, external):
+        """把本地修改（base -> current，按 id）应用到其他进程写入的记录列表上
+
+        本地删除的记录删除；本地修改的记录替换（对方已删除时重新加入）；本地新增的记录追加到末尾。
+        对方新增的记录与本地新增的记录 id 相同时，给对方的记录分配新 id。
+        """
+        base_by_id = {record['id']: record for record in base}
+        current_ids = {record['id'] for record in current}
+        deleted = base_by_id.keys() - current_ids
+        added = current_ids - base_by_id.keys()
+        changed = {record['id']: record for record in current if base_by_id.get(record['id']) is not record}
+        records = []
+        for record in external:
+            record_id = record['id']
+            if record_id in added:
+                record = dict(record, id=self._new_id())
+            elif record_id in deleted:
+                continue
+            elif record_id in changed:
+                record = changed.pop(record_id)
+            records.append(record)
+        records.extend(changed.values())
+        return records
+
+    # ---------- 读取 ----------
+
+    def get(self):
+        """返回当前数据"""
+        self._ensure_loaded()
+        self._check_external()
+        return self._data
+
+    def copy(self):
+        """返回数据的浅拷贝，可以在锁外长时间使用（例如导出 Excel）
+
+        修改记录时总是替换记录对象，不会原地修改，因此只需复制列表。
+        """
+        self._ensure_loaded()
+        self._check_external()
+        with self._lock:
+            return {record_type: list(records) for record_type, records in self._data.items()}
+
+    def version_tag(self):
+        """当前数据版本的标识（启动标识-版本号）"""
+        self._ensure_loaded()
+        self._check_external()
+        return f'{self.epoch}-{self.version}'
+
+    def etag(self):
+        """当前数据版本的 ETag（带引号的版本标识）"""
+        return f'"{self.version_tag()}"'
+
+    def etag_for(self, change):
+        """修改后的 ETag：有变更时为变更对应的版本，没有变化时为当前版本"""
+        if change is None:
+            return self.etag()
+        return f'"{change["epoch"]}-{change["version"]}"'
+
+    def query(self, record_type, **options):
+        """使用索引查询一种记录（参数见 RecordIndex.query），返回 (结果, 版本标识)"""
+        self._ensure_loaded()
+        self._check_external()
+        with self._lock:
+            return self.index.query(record_type, **options), f'{self.epoch}-{self.version}'
+
+    def report(self):
+        """返回 (汇总, 版本标识)，见 FinanceSummary.report"""
+        self._ensure_loaded()
+        self._check_external()
+        with self._lock:
+            return self.summary.report(), f'{self.epoch}-{self.version}'
+
+    def stats(self):
+        """运行指标用的状态：各类型记录数、存储文件大小（字节）、版本号、是否有未写回的修改"""
+        self._ensure_loaded()
+        with self._lock:
+            records = {record_type: len(records) for record_type, records in self._data.items()}
+            version, dirty = self.version, int(self._dirty or self._flushing)
+        files = {}
+        for path in self.backend.files():
+            try:
+                files[os.path.basename(path)] = os.path.getsize(path)
+            except OSError:
+                pass
+        return {'records': records, 'files': files, 'version': version, 'dirty': dirty}
+
+    def wait_changes(self, epoch, version, timeout):
+        """返回版本 epoch-version 之后的变更列表；暂时没有新变更时最多等待 timeout 秒，返回 []
+
+        无法补齐（服务器重启过、版本过旧已不在缓冲区中）时返回 None，客户端需要重新加载全部数据。
+        等待期间每秒检查一次数据文件是否被其他进程改写。
+        """
+        self._ensure_loaded()
+        deadline = time.monotonic() + timeout
+        while True:
+            self._check_external()
+            with self._lock:
+                if epoch != self.epoch or version > self.version:
+                    return None
+                if version < self.version:
+                    if not self._changes or self._changes[0]['version'] > version + 1:
+                        return None
+                    return [change for change in self._changes if change['version'] > version]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._changed.wait(min(remaining, 1))
+
+    def _check_if_match(self, if_match):
+        """If-Match 不为空且与当前版本不一致时抛出 VersionConflict（需持有锁）"""
+        etag = f'"{self.epoch}-{self.version}"'
+        if if_match and not etag_matches(if_match, etag):
+            raise VersionConflict(etag)
+
+    def encoded(self):
+        """当前数据的紧凑 JSON 字节，每个版本只序列化一次"""
+        return self.encoded_with_version()[0]
+
+    def encoded_with_version(self):
+        """返回同一时刻的 (紧凑 JSON 字节, 启动标识, 版本号)"""
+        self._ensure_loaded()
+        self._check_external()
+        with self._lock:
+            return self._encoded_locked(), self.epoch, self.version
+
+    def _encoded_locked(self):
+        if self._encoded is None:
+            self._encoded = encode_data(self._data)
+        return self._encoded
+
+    # ---------- 写入 ----------
+
+    def replace(self, data, if_match=None):
+        """用新数据整体替换（只记录有变化的部分）"""
+        data = normalize_data(data)
+        self._ensure_loaded()
+        self._check_external()
+        with self._lock:
+            self._check_if_match(if_match)
+            self._assign_ids(data, self._data)
+            return self._apply(diff_data(self._data, data))
+
+    def create(self, record_type, record, if_match=None):
+        """新增一条记录（追加到末尾），返回 (带 id 的记录, 变更)"""
+        record = self._check_record(record_type, record)
+        self._ensure_loaded()
+        self._check_external()
+        with self._lock:
+            self._check_if_match(if_match)
+            record['id'] = self._new_id()
+            start = len(self._data[record_type])
+            change = self._apply([{'type': record_type, 'start': start, 'delete': 0, 'records': [record]}])
+            return record, change
+
+    def update(self, record_type, record_id, record, if_match=None):
+        """替换指定 id 的记录，返回 (新记录, 变更)；记录不存在时抛出 KeyError"""
+        record = self._check_record(record_type, record)
+        self._ensure_loaded()
+        self._check_external()
+        with self._lock:
+            self._check_if_match(if_match)
+            start = self._position(record_type, record_id)
+            record['id'] = record_id
+            change = self._apply([{'type': record_type, 'start': start, 'delete': 1, 'records': [record]}])
+            return record, change
+
+    def delete(self, record_type, record_id, if_match=None):
+        """删除指定 id 的记录，返回变更；记录不存在时抛出 KeyError"""
+        self._check_type(record_type)
+        self._ensure_loaded()
+        self._check_external()
+        with self._lock:
+            self._check_if_match(if_match)
+            start = self._position(record_type, record_id)
+            return self._apply([{'type': record_type, 'start': start, 'delete': 1, 'records': []}])
+
+    def _check_type(self, record_type):
+        if record_type not in RECORD_TYPES:
+            raise ValueError(f"未知的数据类型: {record_type}")
+
+    def _check_record(self, record_type, record):
+        self._check_type(record_type)
+        if not isinstance(record, dict):
+            raise ValueError("数据格式错误：记录应为 JSON 对象")
+        for field in HASH_FIELDS:
+            if isinstance(record.get(field), (list, dict)):
+                raise ValueError(f"数据格式错误：{field} 应为文本")
+        return {k: v for k, v in record.items() if k != 'id'}
+
+    def _position(self, record_type, record_id):
+        """记录在列表中的位置：id 按新增顺序递增，通常可以二分查找，找不到时再逐条查找"""
+        records = self._data[record_type]
+        lo, hi = 0, len(records)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if records[mid]['id'] < record_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(records) and records[lo]['id'] == record_id:
+            return lo
+        for index, record in enumerate(records):
+            if record['id'] == record_id:
+                return index
+        raise KeyError(record_id)
+
+    def _apply(self, ops, persist=True):
+        """应用修改并安排持久化，返回变更；没有实际修改时版本号不变，返回 None"""
+        if not ops:
+            return None
+        applied = []
+        try:
+            for op in ops:
+                records = self._data[op['type']]
+                end = op['start'] + op['delete']
+                removed = records[op['start']:end]
+                records[op['start']:end] = op['records']
+                applied.append((op, removed))
+                for observer in self._observers:
+                    observer.update(op['type'], removed, op['records'])
+        except Exception:
+            # 观察者出错时撤销已应用的修改并重建索引和汇总，数据、索引、版本号保持一致
+            for op, removed in reversed(applied):
+                self._data[op['type']][op['start']:op['start'] + len(op['records'])] = removed
+            for observer in self._observers:
+                observer.reset(self._data)
+            raise
+        if persist:
+            self._unflushed.extend(applied)
+        self._encoded = None
+        self.version += 1
+        if persist:
+            if self.backend.wants_ops:
+                self._pending.extend(ops)
+            self._mark_dirty()
+        change = {'epoch': self.epoch, 'version': self.version, 'ops': ops}
+        self._changes.append(change)
+        self._changed.notify_all()
+        return change
+
+    def _mark_dirty(self):
+        with self._lock:
+            self._dirty = True
+            self._wakeup.notify()
+
+    def _write_behind(self):
+        """后台写回线程：有修改时等待 flush_delay 秒合并后续修改，再写一次；
+        日志存储方式下没有修改时也会定期检查是否需要压缩"""
+        while True:
+            with self._lock:
+                while not self._dirty and not self._closed:
+                    self._wakeup.wait(timeout=60 if self.backend.wants_ops else None)
+                    if self.backend.wants_ops and self.backend.wants_snapshot():
+                        break
+                if self._closed:
+                    return
+            time.sleep(self.flush_delay)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"✗ 数据写回失败，稍后重试: {e}")
+                time.sleep(1)
+
+    def flush(self, compact=False):
+        """立即持久化未写回的修改；compact=True 时同时写出完整快照"""
+        with self._write_lock:
+            with self._lock:
+                if self._data is None:
+                    return
+                # 写回前再检查一次，不覆盖其他进程刚写入的数据
+                if self.backend.changed_externally():
+                    self._reload()
+                snapshot_needed = self._snapshot_pending or self.backend.wants_snapshot(force=compact)
+                if not self._dirty and not (snapshot_needed and self.backend.wants_ops):
+                    return
+                ops, self._pending = self._pending, []
+                unflushed, self._unflushed = self._unflushed, []
+                snapshot = self._encoded_locked() if snapshot_needed else None
+                self._dirty = False
+                self._snapshot_pending = False
+                self._flushing = True
+            try:
+                with metrics.timed('store_persist'):
+                    self.backend.persist(ops, snapshot)
+            except BaseException:
+                # 日志可能只写入了半行，重试时改为写出完整快照
+                with self._lock:
+                    self._snapshot_pending = True
+                    self._unflushed[:0] = unflushed
+                self._mark_dirty()
+                raise
+            finally:
+                self._flushing = False
+
+    def close(self):
+        """停止后台线程，写回剩余修改并压缩日志（服务器退出时调用）"""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        self.flush(compact=self.backend.wants_ops)
+        self.backend.close()
+
+
+def migrate(path):
+    """把 JSON 数据文件一次性导入 SQLite 数据库（分配 id 后写入），返回是否成功"""
+    if not os.path.exists(path):
+        print(f"✗ 数据文件不存在: {path}")
+        return False
+    try:
+        SnapshotBackend(path).load()
+    except CorruptDataFile as e:
+        print(f"✗ {e}")
+        return False
+    store = FinanceStore(path, storage='sqlite')
+    try:
+        data = store.get()
+    finally:
+        store.close()
+    counts = ', '.join(f"{record_type} {len(records)} 条" for record_type, records in data.items())
+    print(f"✓ 数据已保存到 {store.backend.db_path}（{counts}）")
+    print("  启动服务器时使用 --storage sqlite 或环境变量 FINANCE_STORAGE=sqlite")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='家庭财务管理系统 - 服务器数据仓库工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help='把 JSON 数据文件迁移到 SQLite 数据库')
+    migrate_parser.add_argument('path', nargs='?', default='finance_data.json',
+                                help='JSON 数据文件（默认 finance_data.json）；数据库保存在同目录的 .sqlite3 文件')
+    args = parser.parse_args()
+
+    if args.command == 'migrate' and not migrate(args.path):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
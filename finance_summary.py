@@ -0,0 +1,136 @@
+"""
+家庭财务管理系统 - 增量汇总
+
+服务器数据仓库在每次修改时更新的汇总（与网页仪表盘、Excel 仪表盘的六项指标一致）：
+1. 总入金、总还款、总报税、总缴税、TFSA 余额、教育基金余额
+2. 按月份（yyyy-mm）和按类别的分项合计
+
+新增、删除记录时只加减这条记录的金额，读取汇总的耗时与记录数无关。
+金额以分（整数）累加，避免浮点误差；无法解析的金额按 0 计。
+"""
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from finance_query import DATE_FIELDS
+
+
+# 仪表盘指标 -> (记录类型, 金额字段)
+TOTALS = {
+    'totalDeposit': ('deposit', 'amount'),
+    'totalLoan': ('loan', 'amount'),
+    'totalTax': ('tax', 'taxAmount'),
+    'totalTaxPaid': ('tax', 'paidAmount'),
+    'tfsaBalance': ('tfsa', 'balance'),
+    'eduBalance': ('education', 'balance')
+}
+
+# 收支记录也按月份、类别汇总（仪表盘之外的分项）
+AMOUNT_FIELDS = {
+    'deposit': ('amount',),
+    'loan': ('amount',),
+    'tax': ('taxAmount', 'paidAmount'),
+    'tfsa': ('balance',),
+    'education': ('balance',),
+    'expense': ('amount',)
+}
+
+# 按类别汇总时使用的字段
+CATEGORY_FIELDS = {
+    'deposit': 'source',
+    'loan': 'loanType',
+    'tax': 'year',
+    'tfsa': 'bank',
+    'education': 'bank',
+    'expense': 'category'
+}
+
+
+def to_cents(value):
+    """把金额（数字或 "1,234.50" 这样的文本）转换为分；无法解析时返回 0"""
+    if value is None or isinstance(value, bool):
+        return 0
+    if type(value) is int:
+        return value * 100
+    text = str(value).strip().replace(',', '').replace('¥', '').replace('$', '')
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        return 0
+    if not amount.is_finite():
+        return 0
+    return int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return cents / 100
+
+
+class Bucket:
+    """按键分组的合计：键 -> [金额(分), 记录数]，记录数为 0 时移除该键"""
+
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, key, cents, sign):
+        group = self.groups.setdefault(key, [0, 0])
+        group[0] += sign * cents
+        group[1] += sign
+        if not group[1]:
+            del self.groups[key]
+
+    def report(self):
+        return {key: from_cents(group[0]) for key, group in sorted(self.groups.items())}
+
+
+class FinanceSummary:
+    """全部记录的汇总；由数据仓库在持有锁时调用 reset() / update()"""
+
+    def __init__(self):
+        self.reset({})
+
+    def reset(self, data):
+        self.counts = {record_type: 0 for record_type in AMOUNT_FIELDS}
+        self.sums = {(t, f): 0 for t, fields in AMOUNT_FIELDS.items() for f in fields}
+        self.months = {key: Bucket() for key in self.sums}
+        self.categories = {key: Bucket() for key in self.sums}
+        for record_type, records in data.items():
+            if record_type in AMOUNT_FIELDS:
+                self.update(record_type, [], records)
+
+    def update(self, record_type, removed, added):
+        for sign, records in ((-1, removed), (1, added)):
+            for record in records:
+                self._add(record_type, record, sign)
+
+    def _add(self, record_type, record, sign):
+        self.counts[record_type] += sign
+        month = str(record.get(DATE_FIELDS[record_type]) or '')[:7]
+        category = str(record.get(CATEGORY_FIELDS[record_type]) or '')
+        for field in AMOUNT_FIELDS[record_type]:
+            key = (record_type, field)
+            cents = to_cents(record.get(field))
+            self.sums[key] += sign * cents
+            self.months[key].add(month, cents, sign)
+            self.categories[key].add(category, cents, sign)
+
+    def totals(self):
+        """仪表盘六项指标"""
+        return {name: from_cents(self.sums[key]) for name, key in TOTALS.items()}
+
+    def report(self):
+        """完整汇总：指标、各类型记录数、按月份和按类别的分项合计
+
+        分项为 {类型: {金额字段: {月份或类别: 合计}}}，没有日期或类别的记录归入空字符串键。
+        """
+        def breakdown(buckets):
+            result = {}
+            for (record_type, field), bucket in buckets.items():
+                result.setdefault(record_type, {})[field] = bucket.report()
+            return result
+
+        return {
+            'totals': self.totals(),
+            'counts': dict(self.counts),
+            'byMonth': breakdown(self.months),
+            'byCategory': breakdown(self.categories)
+        }
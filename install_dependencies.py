@@ -30,8 +30,7 @@ print("="*60)
 packages = [
     ('flask', 'flask'),
     ('flask-cors', 'flask_cors'),
-    ('openpyxl', 'openpyxl'),
-    ('pandas', 'pandas')
+    ('openpyxl', 'openpyxl')
 ]
 
 success_count = 0
@@ -5,124 +5,101 @@
 数据保存在服务器端，确保所有设备看到的是同一份数据。
 """
 
-from flask import Flask, render_template_string, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-import json
+import atexit
 import os
+import threading
+import time
 from datetime import datetime
 
+from finance_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, metrics
+from finance_page import PageCache, event_stream
+from finance_profile import PROFILE_HEADER, is_local, profiler
+from finance_query import query_options
+from finance_store import FinanceStore, VersionConflict, etag_matches
+
 app = Flask(__name__)
 CORS(app)  # 允许跨域访问
 
 # 数据文件
 DATA_FILE = 'finance_data.json'
 HTML_FILE = 'family_finance_web.html'
+STORAGE = os.environ.get('FINANCE_STORAGE', 'json')  # 数据存储方式：json / journal / sqlite
 
-# 初始化数据文件
-if not os.path.exists(DATA_FILE):
-    initial_data = {
-        'deposit': [],
-        'loan': [],
-        'tax': [],
-        'tfsa': [],
-        'education': [],
-        'expense': []
-    }
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(initial_data, f, ensure_ascii=False, indent=2)
+# 内存数据仓库（后台写回数据文件）和服务器模式网页缓存
+store = FinanceStore(DATA_FILE, storage=STORAGE)
+page_cache = PageCache(HTML_FILE)
+atexit.register(store.close)
 
 
 def read_data():
-    """读取数据"""
-    try:
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except:
-        return {
-            'deposit': [],
-            'loan': [],
-            'tax': [],
-            'tfsa': [],
-            'education': [],
-            'expense': []
-        }
+    """读取当前数据（浅拷贝，记录对象与仓库共享，调用方不要修改）"""
+    with metrics.timed('read_data'):
+        return store.copy()
+
+
+def save_data(data, if_match=None):
+    """整体保存数据（先更新内存，后台线程稍后写回），返回本次变更"""
+    with metrics.timed('save_data'):
+        return store.replace(data, if_match)
+
+
+def conflict_response(conflict):
+    """If-Match 版本不一致：返回 409 和当前版本"""
+    response = jsonify({'success': False, 'error': str(conflict), 'etag': conflict.etag})
+    response.headers['ETag'] = conflict.etag
+    return response, 409
+
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+    g.profile = profiler.begin(request.remote_addr, request.headers.get(PROFILE_HEADER))
+
+
+@app.after_request
+def observe_request(response):
+    """记录接口、状态码、耗时和响应大小（推送连接只计到返回响应对象）"""
+    started = g.pop('started', None)
+    if started is not None:
+        size = 0 if response.is_streamed else response.calculate_content_length() or 0
+        metrics.observe_request(request.method, request.path, response.status_code,
+                                time.perf_counter() - started, size)
+    profiler.end(g.pop('profile', None), request.method, request.path, response.status_code)
+    return response
+
+
+@app.teardown_request
+def end_profile(error=None):
+    """处理请求时出现异常（没有经过 after_request）时也要结束性能分析"""
+    profiler.end(g.pop('profile', None), request.method, request.path, 500)
 
 
-def save_data(data):
-    """保存数据"""
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+@app.route('/metrics')
+def metrics_endpoint():
+    """运行指标（Prometheus 文本格式）"""
+    return Response(metrics.render(store), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route('/api/profile')
+def api_profile():
+    """最近的请求性能分析结果（只允许本机访问）"""
+    if not is_local(request.remote_addr):
+        return jsonify({'success': False, 'error': '只允许本机访问'}), 403
+    return jsonify(profiler.report(request.args.get('limit', 20, type=int)))
 
 
 @app.route('/')
 def index():
-    """主页 - 返回带服务器端支持的网页"""
-    with open(HTML_FILE, 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    
-    # 读取当前数据并注入到网页
-    data = read_data()
-    data_json = json.dumps(data, ensure_ascii=False, indent=2)
-    
-    # 替换网页中的初始化数据
-    import re
-    html_content = re.sub(
-        r'let financeData = \{[^}]*\};',
-        f'let financeData = {data_json};',
-        html_content,
-        count=1,
-        flags=re.DOTALL
-    )
-    
-    # 修改 saveData 函数，改为保存到服务器
-    new_save_function = '''
-        async function saveData() {
-            try {
-                const response = await fetch('/api/save', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify(financeData)
-                });
-                const result = await response.json();
-                if (result.success) {
-                    console.log('数据已保存到服务器');
-                } else {
-                    console.error('保存失败:', result.error);
-                }
-            } catch (error) {
-                console.error('保存异常:', error);
-            }
-        }
-        
-        // 在添加记录后自动保存
-        const originalAddRecord = addRecord;
-        addRecord = function(type) {
-            originalAddRecord(type);
-            saveData();
-        }
-    '''
-    
-    # 替换原有的 saveData 函数（如果存在）或在适当位置插入
-    html_content = html_content.replace(
-        '// 保存数据到本地存储\n        saveData();',
-        '// 数据自动同步到服务器'
-    )
+    """主页 - 返回带服务器端支持的网页（使用缓存，内容未变化时返回 304）"""
+    body, etag = page_cache.get(store.version_tag(), store.encoded_with_version)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
     
-    # 在 script 标签末尾添加新的保存函数
-    html_content = html_content.replace(
-        '// 页面加载时初始化\n    loadData();',
-        f'''// 页面加载时初始化
-    // 数据已从服务器加载，无需调用 loadData()
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status=304, headers=headers)
     
-    {new_save_function}
-    
-    // 定期自动保存（每30秒）
-    setInterval(saveData, 30000);'''
-    )
-    
-    return render_template_string(html_content)
+    return Response(body, mimetype='text/html', headers=headers)
 
 
 @app.route('/api/save', methods=['POST'])
@@ -130,39 +107,101 @@ def api_save():
     """保存数据接口"""
     try:
         data = request.json
-        save_data(data)
-        return jsonify({'success': True, 'message': '数据保存成功'})
+        change = save_data(data, if_match=request.headers.get('If-Match'))
+        return jsonify({'success': True, 'message': '数据保存成功', 'change': change}), 200, {'ETag': store.etag_for(change)}
+    except VersionConflict as e:
+        return conflict_response(e)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
+@app.route('/api/records/<record_type>', methods=['POST'])
+def api_create_record(record_type):
+    """新增一条记录（由服务器分配 id）"""
+    return record_response('create', record_type)
+
+
+@app.route('/api/records/<record_type>/<int:record_id>', methods=['PUT', 'DELETE'])
+def api_record(record_type, record_id):
+    """修改 / 删除一条记录"""
+    return record_response('update' if request.method == 'PUT' else 'delete', record_type, record_id)
+
+
+def record_response(action, record_type, record_id=None):
+    """执行单条记录的修改，返回记录和本次变更"""
+    try:
+        record = None
+        if_match = request.headers.get('If-Match')
+        if action == 'create':
+            record, change = store.create(record_type, request.get_json(force=True), if_match)
+        elif action == 'update':
+            record, change = store.update(record_type, record_id, request.get_json(force=True), if_match)
+        else:
+            change = store.delete(record_type, record_id, if_match)
+        status = 201 if action == 'create' else 200
+        return jsonify({'success': True, 'record': record, 'change': change}), status, {'ETag': store.etag_for(change)}
+    except VersionConflict as e:
+        return conflict_response(e)
+    except KeyError:
+        return jsonify({'success': False, 'error': f'记录不存在: {record_type}/{record_id}'}), 404
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+
 @app.route('/api/data')
 def api_data():
-    """获取数据接口"""
-    data = read_data()
-    return jsonify(data)
+    """获取数据接口；客户端的 If-None-Match 与当前版本一致时返回 304"""
+    payload, epoch, version = store.encoded_with_version()
+    headers = {'ETag': f'"{epoch}-{version}"', 'Cache-Control': 'no-cache'}
+    
+    if etag_matches(request.headers.get('If-None-Match'), headers['ETag']):
+        return Response(status=304, headers=headers)
+    
+    return Response(payload, mimetype='application/json', headers=headers)
+
+
+@app.route('/api/events')
+def api_events():
+    """数据变更推送（Server-Sent Events），从 Last-Event-ID 或 since 参数指定的版本之后开始"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    return Response(event_stream(store, last_event_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+
+@app.route('/api/summary')
+def api_summary():
+    """仪表盘汇总接口；客户端的 If-None-Match 与当前版本一致时返回 304"""
+    report, version = store.report()
+    headers = {'ETag': f'"{version}"', 'Cache-Control': 'no-cache'}
+    
+    if etag_matches(request.headers.get('If-None-Match'), headers['ETag']):
+        return Response(status=304, headers=headers)
+    
+    return jsonify(dict(report, success=True)), 200, headers
+
+
+@app.route('/api/query')
+def api_query():
+    """按类型、日期范围、类别 / 账户 / 银行过滤并分页返回记录"""
+    try:
+        record_type, options = query_options(request.args.to_dict())
+        result, version = store.query(record_type, **options)
+        return jsonify(dict(result, success=True)), 200, {'ETag': f'"{version}"', 'Cache-Control': 'no-cache'}
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
 
 
 @app.route('/api/export/excel')
 def export_excel():
-    """导出数据到 Excel"""
+    """导出服务器数据到 Excel（进程内调用同步库）"""
     try:
-        data = read_data()
-        
-        # 使用现有的同步工具导出到 Excel
-        import subprocess
-        result = subprocess.run(
-            ['python', 'sync_finance_data.py'],
-            input='2\n',  # 选择网页 -> Excel
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        if result.returncode == 0:
-            return jsonify({'success': True, 'message': 'Excel 导出成功'})
-        else:
-            return jsonify({'success': False, 'error': result.stderr})
+        from sync_finance_data import SyncError
+        try:
+            with sync_lock, metrics.timed('excel_export'):
+                result = get_sync().web_to_excel(data=read_data())
+            return jsonify({'success': True, 'message': 'Excel 导出成功', 'counts': result['counts']})
+        except SyncError as e:
+            return jsonify({'success': False, 'error': str(e)})
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -170,29 +209,36 @@ def export_excel():
 
 @app.route('/api/import/excel')
 def import_excel():
-    """从 Excel 导入数据"""
+    """从 Excel 导入数据到服务器（进程内调用同步库）"""
     try:
-        # 使用现有的同步工具从 Excel 导入
-        import subprocess
-        result = subprocess.run(
-            ['python', 'sync_finance_data.py'],
-            input='1\n',  # 选择 Excel -> 网页
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        if result.returncode == 0:
-            # 读取同步后的数据
-            data = read_data()
+        from sync_finance_data import SyncError
+        try:
+            with sync_lock, metrics.timed('excel_import'):
+                sync = get_sync()
+                sync.backup_excel()
+                data = sync.read_excel_data()
+                save_data(data)
             return jsonify({'success': True, 'message': 'Excel 导入成功', 'data': data})
-        else:
-            return jsonify({'success': False, 'error': result.stderr})
+        except SyncError as e:
+            return jsonify({'success': False, 'error': str(e)})
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
+_sync = None
+sync_lock = threading.Lock()
+
+
+def get_sync():
+    """返回进程内共享的 FinanceDataSync 实例（首次调用时才导入 openpyxl 等依赖）"""
+    global _sync
+    if _sync is None:
+        from sync_finance_data import FinanceDataSync
+        _sync = FinanceDataSync(quiet=True)
+    return _sync
+
+
 def get_local_ip():
     """获取本机 IP 地址"""
     import socket
@@ -214,6 +260,17 @@ if __name__ == '__main__':
     local_ip = get_local_ip()
     port = 5000
     
+    # 加载数据（数据文件不存在时会自动创建）
+    read_data()
+    
+    # 预先加载同步库，Excel 导入导出请求无需再等待模块导入
+    try:
+        from sync_finance_data import preload_excel
+        get_sync()
+        preload_excel()
+    except ImportError as e:
+        print(f"⚠ 未安装 Excel 同步依赖（{e.name}），Excel 导入导出功能不可用")
+    
     print(f"\n📱 手机访问地址: http://{local_ip}:{port}")
     print(f"💻 电脑访问地址: http://localhost:{port}")
     print(f"\n⚠️  确保手机和电脑在同一 WiFi 网络")
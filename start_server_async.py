@@ -0,0 +1,612 @@
+"""
+家庭财务管理系统 - 异步 Web 服务器（使用 Python 标准库 asyncio）
+
+无需安装任何依赖，直接运行即可；接口与 start_server_simple.py 相同。
+所有连接由一个事件循环处理，不为每个连接创建线程：
+家里每台手机、平板保持的变更推送连接几乎不占内存。
+访问数据仓库的处理（可能等待仓库写回时持有的锁、重新读取被改写的数据文件）在一个小线程池中执行，
+Excel 导入导出在单独的进程中执行，都不阻塞事件循环。
+"""
+
+import argparse
+import asyncio
+import collections
+import contextvars
+import http
+import json
+import mimetypes
+import multiprocessing
+import os
+import re
+import socket
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+from finance_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, metrics
+from finance_page import HEARTBEAT_SECONDS, PageCache
+from finance_profile import PROFILE_HEADER, is_local, profiler
+from finance_query import query_options
+from finance_store import BACKENDS, FinanceStore, VersionConflict, etag_matches
+
+# 配置
+PORT = 5000
+DATA_FILE = 'finance_data.json'
+HTML_FILE = 'family_finance_web.html'
+MAX_CONNECTIONS = 1000  # 同时保持的连接数上限（含推送连接），超出时返回 503
+KEEP_ALIVE_TIMEOUT = 5  # 空闲连接保持的秒数
+REQUEST_TIMEOUT = 60    # 读取请求头和请求体的最长秒数
+MAX_BODY_BYTES = 64 * 1024 * 1024  # 请求体上限
+WORKERS = 8             # 执行数据仓库操作的线程数
+HISTORY = 1000          # 推送连接可以补发的最近变更数（与数据仓库保留的变更数相同）
+STORAGE = os.environ.get('FINANCE_STORAGE', 'json')  # 数据存储方式：json / journal / sqlite
+
+# 内存数据仓库（后台写回数据文件）和服务器模式网页缓存
+store = FinanceStore(DATA_FILE, storage=STORAGE)
+page_cache = PageCache(HTML_FILE)
+
+# 当前连接正在分析的请求（每个连接在各自的任务中处理），线程池中的处理也计入该请求
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+# 单条记录接口：/api/records/<类型> 和 /api/records/<类型>/<id>
+RECORD_PATH = re.compile(r'^/api/records/(\w+)(?:/(\d+))?$')
+
+
+# ---------- Excel 进程中执行的函数 ----------
+
+_sync = None
+
+
+def get_sync():
+    """返回 Excel 进程内共享的 FinanceDataSync 实例（首次调用时才导入 openpyxl 等依赖）"""
+    global _sync
+    if _sync is None:
+        from sync_finance_data import FinanceDataSync
+        _sync = FinanceDataSync(quiet=True)
+    return _sync
+
+
+def prepare_sync():
+    """预先加载同步库；未安装依赖时返回缺少的模块名"""
+    try:
+        from sync_finance_data import preload_excel
+        get_sync()
+        preload_excel()
+    except ImportError as e:
+        return e.name
+    return None
+
+
+def export_excel(data):
+    """导出到 Excel，返回各类型记录数"""
+    return get_sync().web_to_excel(data=data)['counts']
+
+
+def import_excel():
+    """备份 Excel 后读取全部数据"""
+    sync = get_sync()
+    sync.backup_excel()
+    return sync.read_excel_data()
+
+
+# ---------- HTTP ----------
+
+class Request:
+    """解析后的 HTTP 请求"""
+
+    def __init__(self, method, target, version, headers, body=b''):
+        parsed = urllib.parse.urlparse(target)
+        self.method = method
+        self.path = urllib.parse.unquote(parsed.path)
+        self.query = dict(urllib.parse.parse_qsl(parsed.query))
+        self.version = version
+        self.headers = headers      # 小写的请求头名称 -> 值
+        self.body = body
+        self.client = ''            # 客户端 IP 地址，由连接处理设置
+
+    def json(self):
+        return json.loads(self.body.decode('utf-8'))
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+
+class Response:
+    def __init__(self, status, body=b'', content_type=None, headers=None):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers or {}
+
+    def encode(self, keep_alive):
+        """响应头和响应体（带 Content-Length，持久连接依赖它划分响应边界）"""
+        lines = [f'HTTP/1.1 {self.status} {http.HTTPStatus(self.status).phrase}']
+        if self.content_type:
+            lines.append(f'Content-Type: {self.content_type}')
+        if self.status != 304:
+            lines.append(f'Content-Length: {len(self.body)}')
+        lines.append('Access-Control-Allow-Origin: *')
+        lines.extend(f'{name}: {value}' for name, value in self.headers.items())
+        lines.append(f'Keep-Alive: timeout={KEEP_ALIVE_TIMEOUT}' if keep_alive else 'Connection: close')
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + self.body
+
+
+def json_response(status, payload, headers=None):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    return Response(status, body, 'application/json; charset=utf-8', headers)
+
+
+def conflict_response(conflict):
+    """If-Match 版本不一致：返回 409 和当前版本"""
+    return json_response(409, {
+        'success': False,
+        'error': str(conflict),
+        'etag': conflict.etag
+    }, {'ETag': conflict.etag})
+
+
+class BadRequest(Exception):
+    """请求格式错误，返回 400 并关闭连接"""
+
+
+class ChangeNotifier:
+    """把数据仓库的变更转给事件循环
+
+    只用一个后台线程等待仓库的变更，把变更交给事件循环保存在 changes 中，再唤醒所有推送连接的协程；
+    推送连接本身不占用线程，也不访问数据仓库（不会因为仓库的锁阻塞事件循环）。
+    每次变更后换一个新的 event：协程先取得当前 event 再检查变更，检查之后发生的变更会设置这个 event，不会错过。
+    """
+
+    def __init__(self, loop, history=HISTORY):
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.epoch, _, version = store.version_tag().rpartition('-')
+        self.version = int(version)
+        self.changes = collections.deque(maxlen=history)
+        threading.Thread(target=self._watch, args=(self.epoch, self.version),
+                         name='finance-changes', daemon=True).start()
+
+    def tag(self):
+        """事件循环已知的最新版本标识"""
+        return f'{self.epoch}-{self.version}'
+
+    def since(self, epoch, version):
+        """版本 epoch-version 之后的变更（在事件循环中调用），规则同 FinanceStore.wait_changes：
+        没有新变更时返回 []，无法补齐时返回 None"""
+        if epoch != self.epoch:
+            return None
+        if version >= self.version:
+            # 客户端可能从其他接口先拿到了后台线程还没转过来的版本，等变更转过来即可
+            return []
+        if not self.changes or self.changes[0]['version'] > version + 1:
+            return None
+        return [change for change in self.changes if change['version'] > version]
+
+    def _watch(self, epoch, version):
+        while True:
+            changes = store.wait_changes(epoch, version, HEARTBEAT_SECONDS)
+            if changes == []:
+                continue
+            if changes is None:
+                epoch, _, version = store.version_tag().rpartition('-')
+                version = int(version)
+            else:
+                version = changes[-1]['version']
+            self.loop.call_soon_threadsafe(self._publish, epoch, version, changes)
+
+    def _publish(self, epoch, version, changes):
+        if changes is None:
+            # 变更太多、后台线程没有跟上：之后连接的推送连接发送 reset，重新加载全部数据
+            self.changes.clear()
+        else:
+            self.changes.extend(changes)
+        self.epoch, self.version = epoch, version
+        event, self.event = self.event, asyncio.Event()
+        event.set()
+
+
+class AsyncFinanceServer:
+    """基于 asyncio 的 HTTP/1.1 服务器"""
+
+    def __init__(self, max_connections=MAX_CONNECTIONS, workers=WORKERS):
+        self.max_connections = max_connections
+        self.connections = 0
+        # Excel 导入导出在一个单独的进程中依次执行
+        # （使用 spawn 方式启动，不从已有后台线程的服务器进程 fork）
+        self.excel_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        self.store_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='finance-store')
+        self.notifier = None
+
+    async def start(self, host, port):
+        loop = asyncio.get_running_loop()
+        self.notifier = await loop.run_in_executor(self.store_pool, ChangeNotifier, loop)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def run_blocking(self, func, *args):
+        """在线程池中执行访问数据仓库（或读取文件）的函数，不阻塞事件循环"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.store_pool, profiler.run, current_profile.get(), func, *args)
+
+    async def handle_connection(self, reader, writer):
+        if self.connections >= self.max_connections:
+            writer.write(Response(503, headers={'Retry-After': '1'}).encode(keep_alive=False))
+            await self._close(writer)
+            return
+        self.connections += 1
+        client = (writer.get_extra_info('peername') or ('',))[0]
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except (BadRequest, ValueError) as e:
+                    writer.write(json_response(400, {'success': False, 'error': str(e)}).encode(False))
+                    break
+                if request is None:
+                    break
+                request.client = client
+
+                if request.method == 'GET' and request.path == '/api/events':
+                    await self.stream_events(request, writer)
+                    break
+
+                started = time.perf_counter()
+                # 性能分析期间事件循环上其他连接的处理也会计入
+                profile = profiler.begin(request.client, request.headers.get(PROFILE_HEADER.lower()))
+                current_profile.set(profile)
+                try:
+                    response = await self.dispatch(request)
+                except Exception as e:
+                    response = json_response(500, {'success': False, 'error': str(e)})
+                except BaseException:
+                    profiler.end(profile, request.method, request.path)
+                    raise
+                profiler.end(profile, request.method, request.path, response.status)
+                writer.write(response.encode(request.keep_alive))
+                await writer.drain()
+                metrics.observe_request(request.method, request.path, response.status,
+                                        time.perf_counter() - started, len(response.body))
+                if not request.keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            await self._close(writer)
+
+    async def _close(self, writer):
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def read_request(self, reader):
+        """读取一个请求；连接空闲超过 KEEP_ALIVE_TIMEOUT 秒时抛出 TimeoutError，
+        在请求之间正常关闭时返回 None"""
+        line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+        if not line:
+            return None
+        return await asyncio.wait_for(self._read_rest(reader, line), REQUEST_TIMEOUT)
+
+    async def _read_rest(self, reader, line):
+        """解析请求行，读取请求头和请求体"""
+        try:
+            method, target, version = line.decode('latin-1').split()
+        except ValueError:
+            raise BadRequest('请求行格式错误')
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            raise BadRequest('不支持分块传输的请求体')
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise BadRequest('Content-Length 格式错误')
+        if length > MAX_BODY_BYTES:
+            raise BadRequest('请求体过大')
+        body = await reader.readexactly(length) if length else b''
+        return Request(method, target, version, headers, body)
+
+    # ---------- 路由 ----------
+
+    async def dispatch(self, request):
+        path = request.path
+        match = RECORD_PATH.match(path)
+
+        if request.method == 'GET':
+            if path in ('/', '/index.html'):
+                return await self.run_blocking(self.send_html, request)
+            if path == '/api/data':
+                return await self.run_blocking(self.send_api_data, request)
+            if path == '/api/summary':
+                return await self.run_blocking(self.send_api_summary, request)
+            if path == '/api/query':
+                return await self.run_blocking(self.send_api_query, request)
+            if path == '/api/export/excel':
+                return await self.send_api_export()
+            if path == '/api/import/excel':
+                return await self.send_api_import()
+            if path == '/metrics':
+                return Response(200, await self.run_blocking(metrics.render, store), METRICS_CONTENT_TYPE)
+            if path == '/api/profile':
+                return self.send_api_profile(request)
+            return await self.run_blocking(self.send_static, path)
+
+        if request.method == 'POST':
+            if path == '/api/save':
+                return await self.run_blocking(self.send_api_save, request)
+            if match and not match.group(2):
+                return await self.run_blocking(self.send_api_record, request, 'create', match.group(1))
+            return json_response(404, {'success': False, 'error': 'API not found'})
+
+        if request.method in ('PUT', 'DELETE'):
+            if match and match.group(2):
+                action = 'update' if request.method == 'PUT' else 'delete'
+                return await self.run_blocking(self.send_api_record, request, action, match.group(1),
+                                               int(match.group(2)))
+            return json_response(404, {'success': False, 'error': 'API not found'})
+
+        return json_response(501, {'success': False, 'error': f'不支持的请求方法: {request.method}'})
+
+    def send_html(self, request):
+        """返回带有服务器数据的 HTML（使用缓存，内容未变化时返回 304）"""
+        if not os.path.exists(HTML_FILE):
+            return json_response(404, {'success': False, 'error': f'HTML file not found: {HTML_FILE}'})
+
+        body, etag = page_cache.get(store.version_tag(), store.encoded_with_version)
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return Response(304, headers=headers)
+        return Response(200, body, 'text/html; charset=utf-8', headers)
+
+    def send_api_data(self, request):
+        """返回当前数据；客户端的 If-None-Match 与当前版本一致时返回 304"""
+        payload, epoch, version = store.encoded_with_version()
+        headers = {'ETag': f'"{epoch}-{version}"', 'Cache-Control': 'no-cache'}
+        if etag_matches(request.headers.get('if-none-match'), headers['ETag']):
+            return Response(304, headers=headers)
+        return Response(200, payload, 'application/json; charset=utf-8', headers)
+
+    def send_api_summary(self, request):
+        """返回仪表盘汇总；客户端的 If-None-Match 与当前版本一致时返回 304"""
+        report, version = store.report()
+        headers = {'ETag': f'"{version}"', 'Cache-Control': 'no-cache'}
+        if etag_matches(request.headers.get('if-none-match'), headers['ETag']):
+            return Response(304, headers=headers)
+        return json_response(200, dict(report, success=True), headers)
+
+    def send_api_query(self, request):
+        """按类型、日期范围、类别 / 账户 / 银行过滤并分页返回记录"""
+        try:
+            record_type, options = query_options(request.query)
+            result, version = store.query(record_type, **options)
+        except ValueError as e:
+            return json_response(400, {'success': False, 'error': str(e)})
+        return json_response(200, dict(result, success=True), {'ETag': f'"{version}"', 'Cache-Control': 'no-cache'})
+
+    def send_api_profile(self, request):
+        """最近的请求性能分析结果（只允许本机访问）"""
+        if not is_local(request.client):
+            return json_response(403, {'success': False, 'error': '只允许本机访问'})
+        try:
+            limit = int(request.query.get('limit') or 20)
+        except ValueError:
+            return json_response(400, {'success': False, 'error': 'limit 应为整数'})
+        return json_response(200, profiler.report(limit))
+
+    def send_api_save(self, request):
+        """保存数据"""
+        try:
+            with metrics.timed('save_data'):
+                change = store.replace(request.json(), request.headers.get('if-match'))
+        except VersionConflict as e:
+            return conflict_response(e)
+        except ValueError as e:
+            return json_response(400, {'success': False, 'error': str(e)})
+        return json_response(200, {
+            'success': True,
+            'message': '数据保存成功',
+            'timestamp': datetime.now().isoformat(),
+            'change': change
+        }, {'ETag': store.etag_for(change)})
+
+    def send_api_record(self, request, action, record_type, record_id=None):
+        """新增 / 修改 / 删除单条记录，返回记录和本次变更"""
+        try:
+            record = None
+            if_match = request.headers.get('if-match')
+            if action == 'create':
+                record, change = store.create(record_type, request.json(), if_match)
+            elif action == 'update':
+                record, change = store.update(record_type, record_id, request.json(), if_match)
+            else:
+                change = store.delete(record_type, record_id, if_match)
+        except VersionConflict as e:
+            return conflict_response(e)
+        except KeyError:
+            return json_response(404, {'success': False, 'error': f'记录不存在: {record_type}/{record_id}'})
+        except ValueError as e:
+            return json_response(400, {'success': False, 'error': str(e)})
+        return json_response(201 if action == 'create' else 200, {
+            'success': True,
+            'record': record,
+            'change': change
+        }, {'ETag': store.etag_for(change)})
+
+    async def send_api_export(self):
+        """导出服务器数据到 Excel（在 Excel 进程中执行）"""
+        from sync_finance_data import SyncError
+        loop = asyncio.get_running_loop()
+        try:
+            with metrics.timed('excel_export'):
+                with metrics.timed('read_data'):
+                    data = await self.run_blocking(store.copy)
+                counts = await loop.run_in_executor(self.excel_pool, export_excel, data)
+        except SyncError as e:
+            return json_response(200, {'success': False, 'error': str(e)})
+        return json_response(200, {'success': True, 'message': 'Excel 导出成功', 'counts': counts})
+
+    async def send_api_import(self):
+        """从 Excel 导入数据到服务器（在 Excel 进程中读取）"""
+        from sync_finance_data import SyncError
+        loop = asyncio.get_running_loop()
+        try:
+            with metrics.timed('excel_import'):
+                data = await loop.run_in_executor(self.excel_pool, import_excel)
+                with metrics.timed('save_data'):
+                    await self.run_blocking(store.replace, data)
+        except SyncError as e:
+            return json_response(200, {'success': False, 'error': str(e)})
+        return json_response(200, {'success': True, 'message': 'Excel 导入成功', 'data': data})
+
+    def send_static(self, path):
+        """当前目录下的静态文件（如果有 CSS、JS 等）"""
+        root = os.getcwd()
+        file_path = os.path.normpath(os.path.join(root, path.lstrip('/')))
+        if not file_path.startswith(root + os.sep) or not os.path.isfile(file_path):
+            return json_response(404, {'success': False, 'error': 'File not found'})
+        with open(file_path, 'rb') as f:
+            body = f.read()
+        content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+        return Response(200, body, content_type)
+
+    async def stream_events(self, request, writer):
+        """推送数据变更（Server-Sent Events），从 Last-Event-ID 或 since 参数指定的版本之后开始
+
+        事件格式与 finance_page.event_stream 相同；等待变更时不占用线程，变更从 ChangeNotifier 取得。
+        """
+        last_event_id = request.headers.get('last-event-id') or request.query.get('since')
+        epoch, _, version = (last_event_id or '').rpartition('-')
+        if not epoch or not version.isdigit():
+            epoch, _, version = self.notifier.tag().rpartition('-')
+        version = int(version)
+
+        started = time.perf_counter()
+        writer.write(b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Type: text/event-stream; charset=utf-8\r\n'
+                     b'Cache-Control: no-cache\r\n'
+                     b'Access-Control-Allow-Origin: *\r\n'
+                     b'Connection: close\r\n\r\n'
+                     b'retry: 1000\n\n')
+        await writer.drain()
+        metrics.observe_request(request.method, request.path, 200, time.perf_counter() - started, 0)
+
+        metrics.stream_opened()
+        try:
+            while True:
+                event = self.notifier.event
+                changes = self.notifier.since(epoch, version)
+                if changes is None:
+                    tag = self.notifier.tag()
+                    writer.write(f'event: reset\nid: {tag}\ndata: {json.dumps({"etag": tag})}\n\n'.encode('utf-8'))
+                    epoch, _, version = tag.rpartition('-')
+                    version = int(version)
+                elif changes:
+                    for change in changes:
+                        data = json.dumps(change, ensure_ascii=False, separators=(',', ':'))
+                        writer.write(f'id: {change["epoch"]}-{change["version"]}\ndata: {data}\n\n'.encode('utf-8'))
+                    version = changes[-1]['version']
+                else:
+                    try:
+                        await asyncio.wait_for(event.wait(), HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        writer.write(b': ping\n\n')
+                await writer.drain()
+        finally:
+            metrics.stream_closed()
+
+    def close(self):
+        self.excel_pool.shutdown(wait=False)
+        self.store_pool.shutdown(wait=False)
+
+
+def get_local_ip():
+    """获取本机 IP 地址"""
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        ip = s.getsockname()[0]
+        s.close()
+        return ip
+    except OSError:
+        return "127.0.0.1"
+
+
+async def serve(server, port):
+    listener = await server.start('', port)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    """启动服务器"""
+    parser = argparse.ArgumentParser(description='家庭财务管理系统 - 异步 Web 服务器')
+    parser.add_argument('--port', type=int, default=PORT, help=f'端口（默认 {PORT}）')
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS,
+                        help=f'最大同时连接数（默认 {MAX_CONNECTIONS}）')
+    parser.add_argument('--storage', choices=sorted(BACKENDS), default=STORAGE,
+                        help=f'数据存储方式（默认 {STORAGE}，可用环境变量 FINANCE_STORAGE 设置）')
+    args = parser.parse_args()
+
+    global store
+    if args.storage != store.storage:
+        store = FinanceStore(DATA_FILE, storage=args.storage)
+
+    # 加载数据（数据文件不存在时会自动创建）
+    store.get()
+
+    # 检查 HTML 文件
+    if not os.path.exists(HTML_FILE):
+        print(f"✗ 错误: 找不到网页文件 {HTML_FILE}")
+        return
+
+    server = AsyncFinanceServer(max_connections=args.max_connections)
+
+    # 预先启动 Excel 进程并加载同步库，Excel 导入导出请求无需再等待
+    missing = server.excel_pool.submit(prepare_sync).result()
+    if missing:
+        print(f"⚠ 未安装 Excel 同步依赖（{missing}），Excel 导入导出功能不可用")
+
+    local_ip = get_local_ip()
+
+    print("="*70)
+    print("家庭财务管理系统 - 异步 Web 服务器")
+    print("="*70)
+    print(f"\n✓ 服务器启动成功！")
+    print(f"\n📱 手机访问地址: http://{local_ip}:{args.port}")
+    print(f"💻 电脑访问地址: http://localhost:{args.port}")
+    print(f"\n⚠️  重要提示:")
+    print(f"   1. 确保手机和电脑在同一 WiFi 网络")
+    print(f"   2. 不要关闭此窗口，关闭窗口后服务器停止运行")
+    print(f"   3. 数据自动保存到服务器，其他设备的修改会立即推送到页面")
+    print(f"   4. 页面右上角有'刷新数据'按钮，点击可手动刷新")
+    print("\n" + "="*70)
+    print(f"\n🚀 服务器正在运行（最多 {args.max_connections} 个连接）... (按 Ctrl+C 停止)\n")
+
+    try:
+        asyncio.run(serve(server, args.port))
+    except KeyboardInterrupt:
+        print("\n\n✓ 服务器已停止")
+        print("感谢使用家庭财务管理系统！")
+    finally:
+        server.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,22 +5,94 @@
 在同一局域网内提供网页访问，实现多设备数据同步。
 """
 
+import argparse
 import http.server
-import socketserver
 import json
 import os
+import re
+import threading
+import time
 import urllib.parse
 from datetime import datetime
 import socket
 
+from finance_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, metrics
+from finance_page import PageCache, event_stream
+from finance_profile import PROFILE_HEADER, is_local, profiler
+from finance_query import query_options
+from finance_store import BACKENDS, FinanceStore, VersionConflict, etag_matches
+
 # 配置
 PORT = 5000
 DATA_FILE = 'finance_data.json'
 HTML_FILE = 'family_finance_web.html'
+WORKERS = 8             # 同时处理的请求数上限（空闲的持久连接不计在内）
+MAX_CONNECTIONS = 64    # 同时保持的连接数上限，超出时返回 503
+KEEP_ALIVE_TIMEOUT = 5  # 空闲连接保持的秒数
+MAX_STREAMS = 32        # 同时保持的变更推送连接数上限（每个打开的网页一个）
+STORAGE = os.environ.get('FINANCE_STORAGE', 'json')  # 数据存储方式：json / journal / sqlite
+
+# 内存数据仓库（后台写回数据文件）和服务器模式网页缓存
+store = FinanceStore(DATA_FILE, storage=STORAGE)
+page_cache = PageCache(HTML_FILE)
+
+# Excel 导入导出串行执行
+sync_lock = threading.Lock()
+
+# 单条记录接口：/api/records/<类型> 和 /api/records/<类型>/<id>
+RECORD_PATH = re.compile(r'^/api/records/(\w+)(?:/(\d+))?$')
 
 
 class FinanceHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    """自定义 HTTP 请求处理器"""
+    """自定义 HTTP 请求处理器
+    
+    使用 HTTP/1.1 持久连接：页面的自动保存、刷新等请求复用同一个 TCP 连接。
+    因此每个响应都必须带 Content-Length；连接空闲超过 timeout 秒后关闭。
+    读到请求行后才占用一个工作名额，响应发送完即归还，等待下一个请求时不占用。
+    """
+    
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEP_ALIVE_TIMEOUT
+    # 响应头和响应体分两次写出，关闭 Nagle 避免与客户端的延迟确认叠加出约 40ms 的等待
+    disable_nagle_algorithm = True
+    
+    def parse_request(self):
+        """读到请求行后开始计时（不计持久连接上等待下一个请求的空闲时间），
+        需要时开始性能分析"""
+        self._started = time.perf_counter()
+        self._status = None
+        self._size = 0
+        if not super().parse_request():
+            return False
+        self.server.workers.acquire()
+        self._working = True
+        self._profile = profiler.begin(self.client_address[0], self.headers.get(PROFILE_HEADER))
+        return True
+    
+    def handle_one_request(self):
+        """处理一个请求，结束后记录接口、状态码、耗时和响应大小"""
+        self._started = None
+        self._profile = None
+        self._working = False
+        try:
+            super().handle_one_request()
+        finally:
+            if self._profile is not None:
+                profiler.end(self._profile, self.command, urllib.parse.urlsplit(self.path).path, self._status)
+            if self._working:
+                self.server.workers.release()
+        if self._started is not None and self._status is not None and self.command:
+            metrics.observe_request(self.command, urllib.parse.urlsplit(self.path).path, self._status,
+                                    time.perf_counter() - self._started, self._size)
+    
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+    
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'content-length':
+            self._size = int(value)
+        super().send_header(keyword, value)
     
     def do_GET(self):
         """处理 GET 请求"""
@@ -34,6 +106,18 @@ class FinanceHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         elif parsed_path.path == '/api/data':
             self.send_api_data()
         
+        # API: 数据变更推送（Server-Sent Events）
+        elif parsed_path.path == '/api/events':
+            self.send_event_stream(parsed_path.query)
+        
+        # API: 仪表盘汇总
+        elif parsed_path.path == '/api/summary':
+            self.send_api_summary()
+        
+        # API: 按条件分页查询
+        elif parsed_path.path == '/api/query':
+            self.send_api_query(parsed_path.query)
+        
         # API: 导出到 Excel
         elif parsed_path.path == '/api/export/excel':
             self.send_api_export()
@@ -42,6 +126,14 @@ class FinanceHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         elif parsed_path.path == '/api/import/excel':
             self.send_api_import()
         
+        # 运行指标（Prometheus 文本格式）
+        elif parsed_path.path == '/metrics':
+            self.send_body(200, metrics.render(store), METRICS_CONTENT_TYPE)
+        
+        # 最近的请求性能分析结果（只允许本机访问）
+        elif parsed_path.path == '/api/profile':
+            self.send_api_profile(parsed_path.query)
+        
         # 静态文件（如果有 CSS、JS 等）
         else:
             # 尝试作为静态文件服务
@@ -50,347 +142,362 @@ class FinanceHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     def do_POST(self):
         """处理 POST 请求"""
         parsed_path = urllib.parse.urlparse(self.path)
+        match = RECORD_PATH.match(parsed_path.path)
         
         # API: 保存数据
         if parsed_path.path == '/api/save':
             self.send_api_save()
+        
+        # API: 新增一条记录
+        elif match and not match.group(2):
+            self.send_api_record('create', match.group(1))
+        else:
+            self.send_error(404, "API not found")
+    
+    def do_PUT(self):
+        """处理 PUT 请求：修改一条记录"""
+        match = RECORD_PATH.match(urllib.parse.urlparse(self.path).path)
+        if match and match.group(2):
+            self.send_api_record('update', match.group(1), int(match.group(2)))
+        else:
+            self.send_error(404, "API not found")
+    
+    def do_DELETE(self):
+        """处理 DELETE 请求：删除一条记录"""
+        match = RECORD_PATH.match(urllib.parse.urlparse(self.path).path)
+        if match and match.group(2):
+            self.send_api_record('delete', match.group(1), int(match.group(2)))
         else:
             self.send_error(404, "API not found")
     
     def send_html(self):
-        """返回带有服务器数据的 HTML"""
+        """返回带有服务器数据的 HTML（使用缓存，内容未变化时返回 304）"""
         try:
-            # 读取 HTML 模板
             if not os.path.exists(HTML_FILE):
                 self.send_error(404, f"HTML file not found: {HTML_FILE}")
                 return
             
-            with open(HTML_FILE, 'r', encoding='utf-8') as f:
-                html_content = f.read()
+            body, etag = page_cache.get(store.version_tag(), store.encoded_with_version)
+            headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
             
-            # 读取当前数据
-            data = read_data()
-            data_json = json.dumps(data, ensure_ascii=False, indent=2)
+            if etag_matches(self.headers.get('If-None-Match'), etag):
+                self.send_body(304, b'', None, headers)
+                return
             
-            # 替换网页中的初始化数据
-            import re
-            html_content = re.sub(
-                r'let financeData = \{[^}]*\};',
-                f'let financeData = {data_json};',
-                html_content,
-                count=1,
-                flags=re.DOTALL
-            )
+            self.send_body(200, body, 'text/html; charset=utf-8', headers)
             
-            # 注入服务器同步脚本
-            server_script = '''
-        // ========== 服务器同步功能 ==========
-        
-        // 保存数据到服务器
-        async function saveToServer() {
-            try {
-                const response = await fetch('/api/save', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify(financeData)
-                });
-                
-                const result = await response.json();
-                if (result.success) {
-                    console.log('✓ 数据已同步到服务器', new Date().toLocaleTimeString());
-                    showToast('数据已保存');
-                } else {
-                    console.error('✗ 保存失败:', result.error);
-                    showToast('保存失败: ' + result.error);
-                }
-            } catch (error) {
-                console.error('✗ 同步异常:', error);
-                showToast('网络连接失败');
-            }
-        }
-        
-        // 从服务器刷新数据
-        async function refreshFromServer() {
-            try {
-                const response = await fetch('/api/data');
-                const data = await response.json();
-                
-                financeData = data;
-                renderAll();
-                console.log('✓ 数据已从服务器刷新', new Date().toLocaleTimeString());
-                showToast('数据已刷新');
-                
-            } catch (error) {
-                console.error('✗ 刷新失败:', error);
-                showToast('刷新失败');
-            }
-        }
-        
-        // 显示提示信息
-        function showToast(message) {
-            const toast = document.createElement('div');
-            toast.style.cssText = `
-                position: fixed;
-                top: 20px;
-                right: 20px;
-                background: #4472C4;
-                color: white;
-                padding: 12px 24px;
-                border-radius: 8px;
-                box-shadow: 0 4px 12px rgba(0,0,0,0.15);
-                z-index: 10000;
-                animation: slideIn 0.3s ease;
-            `;
-            toast.textContent = message;
-            document.body.appendChild(toast);
+        except Exception as e:
+            self.send_error(500, f"Server error: {str(e)}")
+    
+    def send_api_data(self):
+        """返回当前数据；客户端的 If-None-Match 与当前版本一致时返回 304"""
+        try:
+            payload, epoch, version = store.encoded_with_version()
+            headers = {'ETag': f'"{epoch}-{version}"', 'Cache-Control': 'no-cache'}
             
-            setTimeout(() => {
-                toast.style.animation = 'slideOut 0.3s ease';
-                setTimeout(() => toast.remove(), 300);
-            }, 2000);
-        }
-        
-        // 添加动画样式
-        const style = document.createElement('style');
-        style.textContent = `
-            @keyframes slideIn {
-                from { transform: translateX(100%); opacity: 0; }
-                to { transform: translateX(0); opacity: 1; }
-            }
-            @keyframes slideOut {
-                from { transform: translateX(0); opacity: 1; }
-                to { transform: translateX(100%); opacity: 0; }
-            }
-        `;
-        document.head.appendChild(style);
-        
-        // 添加刷新按钮到页面右上角
-        const refreshBtn = document.createElement('button');
-        refreshBtn.innerHTML = '🔄 刷新数据';
-        refreshBtn.style.cssText = `
-            position: fixed;
-            top: 20px;
-            right: 20px;
-            z-index: 9999;
-            background: white;
-            border: 2px solid #4472C4;
-            color: #4472C4;
-            padding: 8px 16px;
-            border-radius: 6px;
-            cursor: pointer;
-            font-size: 14px;
-            font-weight: 600;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            transition: all 0.2s;
-        `;
-        refreshBtn.onmouseover = function() {
-            this.style.background = '#4472C4';
-            this.style.color = 'white';
-        };
-        refreshBtn.onmouseout = function() {
-            this.style.background = 'white';
-            this.style.color = '#4472C4';
-        };
-        refreshBtn.onclick = refreshFromServer;
-        document.body.appendChild(refreshBtn);
+            if etag_matches(self.headers.get('If-None-Match'), headers['ETag']):
+                self.send_body(304, b'', None, headers)
+                return
+            
+            self.send_body(200, payload, 'application/json; charset=utf-8', headers)
+            
+        except Exception as e:
+            self.send_error(500, str(e))
+    
+    def send_event_stream(self, query_string):
+        """推送数据变更（Server-Sent Events），从 Last-Event-ID 或 since 参数指定的版本之后开始
         
-        // 重写原始的 addRecord 函数，添加自动保存
-        const originalAddRecord = addRecord;
-        addRecord = function(type) {
-            originalAddRecord(type);
-            setTimeout(saveToServer, 100); // 延迟保存，确保数据已更新
-        }
+        发送响应头后把连接交给单独的推送线程，不占用连接名额和工作名额。
+        """
+        params = dict(urllib.parse.parse_qsl(query_string))
+        last_event_id = self.headers.get('Last-Event-ID') or params.get('since')
         
-        // 定期自动保存（每60秒）
-        setInterval(saveToServer, 60000);
+        if not self.server.streams.acquire(blocking=False):
+            self.send_json(503, {'success': False, 'error': '推送连接数已满'}, {'Retry-After': '5'})
+            return
         
-        // 页面卸载前保存
-        window.addEventListener('beforeunload', saveToServer);
+        try:
+            # 事件流没有 Content-Length，以关闭连接结束
+            self.close_connection = True
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+        except OSError:
+            self.server.streams.release()
+            raise
         
-        // 替换原有的 loadData 调用
-        console.log('服务器模式启动 - 数据已从服务器加载');
-'''
+        self.server.start_stream(self.connection, last_event_id)
+    
+    def send_api_summary(self):
+        """返回仪表盘汇总；客户端的 If-None-Match 与当前版本一致时返回 304"""
+        try:
+            report, version = store.report()
+            headers = {'ETag': f'"{version}"', 'Cache-Control': 'no-cache'}
             
-            # 在 script 标签末尾添加服务器脚本
-            html_content = html_content.replace(
-                '// 页面加载时初始化\n    loadData();',
-                f'{server_script}\n        // 页面加载时初始化\n        // 数据已从服务器加载，无需调用 loadData()\n'
-            )
+            if etag_matches(self.headers.get('If-None-Match'), headers['ETag']):
+                self.send_body(304, b'', None, headers)
+                return
             
-            # 返回 HTML
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(html_content.encode('utf-8'))
+            self.send_json(200, dict(report, success=True), headers)
             
         except Exception as e:
-            self.send_error(500, f"Server error: {str(e)}")
+            self.send_json(500, {'success': False, 'error': str(e)})
     
-    def send_api_data(self):
-        """返回当前数据"""
+    def send_api_query(self, query_string):
+        """按类型、日期范围、类别 / 账户 / 银行过滤并分页返回记录"""
         try:
-            data = read_data()
-            response = json.dumps(data, ensure_ascii=False, indent=2)
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(response.encode('utf-8'))
+            params = dict(urllib.parse.parse_qsl(query_string))
+            record_type, options = query_options(params)
+            result, version = store.query(record_type, **options)
+            self.send_json(200, dict(result, success=True), {'ETag': f'"{version}"', 'Cache-Control': 'no-cache'})
             
+        except ValueError as e:
+            self.send_json(400, {'success': False, 'error': str(e)})
         except Exception as e:
-            self.send_error(500, str(e))
+            self.send_json(500, {'success': False, 'error': str(e)})
+    
+    def send_api_profile(self, query_string):
+        """列出最近分析过的请求和累计耗时最多的函数"""
+        if not is_local(self.client_address[0]):
+            self.send_json(403, {'success': False, 'error': '只允许本机访问'})
+            return
+        try:
+            limit = int(dict(urllib.parse.parse_qsl(query_string)).get('limit') or 20)
+        except ValueError:
+            self.send_json(400, {'success': False, 'error': 'limit 应为整数'})
+            return
+        self.send_json(200, profiler.report(limit))
     
     def send_api_save(self):
         """保存数据"""
         try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
+            data = self.read_json_body()
             
-            save_data(data)
+            change = save_data(data, if_match=self.headers.get('If-Match'))
             
-            response = json.dumps({
+            self.send_json(200, {
                 'success': True,
                 'message': '数据保存成功',
-                'timestamp': datetime.now().isoformat()
-            }, ensure_ascii=False)
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(response.encode('utf-8'))
+                'timestamp': datetime.now().isoformat(),
+                'change': change
+            }, {'ETag': store.etag_for(change)})
             
+        except VersionConflict as e:
+            self.send_conflict(e)
         except Exception as e:
-            response = json.dumps({
+            # 请求体可能没有读完，不能再在这个连接上解析下一个请求
+            self.close_connection = True
+            self.send_json(500, {
                 'success': False,
                 'error': str(e)
-            }, ensure_ascii=False)
-            
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(response.encode('utf-8'))
+            })
     
-    def send_api_export(self):
-        """导出数据到 Excel（调用同步脚本）"""
+    def send_api_record(self, action, record_type, record_id=None):
+        """新增 / 修改 / 删除单条记录，返回记录和本次变更"""
         try:
-            import subprocess
+            record = None
+            if_match = self.headers.get('If-Match')
+            if action == 'create':
+                record, change = store.create(record_type, self.read_json_body(), if_match)
+            elif action == 'update':
+                record, change = store.update(record_type, record_id, self.read_json_body(), if_match)
+            else:
+                change = store.delete(record_type, record_id, if_match)
             
-            # 调用同步脚本
-            result = subprocess.run(
-                ['python', 'sync_finance_data.py'],
-                input='2\n',
-                capture_output=True,
-                text=True,
-                timeout=30,
-                cwd=os.getcwd()
-            )
+            self.send_json(201 if action == 'create' else 200, {
+                'success': True,
+                'record': record,
+                'change': change
+            }, {'ETag': store.etag_for(change)})
             
-            if result.returncode == 0:
-                response = json.dumps({
+        except VersionConflict as e:
+            self.send_conflict(e)
+        except KeyError:
+            self.send_json(404, {'success': False, 'error': f'记录不存在: {record_type}/{record_id}'})
+        except ValueError as e:
+            self.send_json(400, {'success': False, 'error': str(e)})
+        except Exception as e:
+            self.close_connection = True
+            self.send_json(500, {'success': False, 'error': str(e)})
+    
+    def read_json_body(self):
+        """读取 JSON 请求体；请求体读取失败时关闭连接（无法确定下一个请求的起点）"""
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length)
+        except Exception:
+            self.close_connection = True
+            raise
+        return json.loads(body.decode('utf-8'))
+    
+    def send_body(self, status, body, content_type, headers=None):
+        """返回带 Content-Length 的完整响应（持久连接依赖它划分响应边界）"""
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-type', content_type)
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        else:
+            self.send_header('Keep-Alive', f'timeout={self.timeout}')
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_json(self, status, payload, headers=None):
+        """返回 JSON 响应"""
+        response = json.dumps(payload, ensure_ascii=False)
+        self.send_body(status, response.encode('utf-8'), 'application/json; charset=utf-8', headers)
+    
+    def send_conflict(self, conflict):
+        """If-Match 版本不一致：返回 409 和当前版本"""
+        self.send_json(409, {
+            'success': False,
+            'error': str(conflict),
+            'etag': conflict.etag
+        }, {'ETag': conflict.etag})
+    
+    def send_api_export(self):
+        """导出服务器数据到 Excel（进程内调用同步库）"""
+        try:
+            from sync_finance_data import SyncError
+            try:
+                with sync_lock, metrics.timed('excel_export'):
+                    result = get_sync().web_to_excel(data=read_data())
+                self.send_json(200, {
                     'success': True,
                     'message': 'Excel 导出成功',
-                    'output': result.stdout
-                }, ensure_ascii=False)
-            else:
-                response = json.dumps({
-                    'success': False,
-                    'error': result.stderr or '导出失败'
-                }, ensure_ascii=False)
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(response.encode('utf-8'))
+                    'counts': result['counts']
+                })
+            except SyncError as e:
+                self.send_json(200, {'success': False, 'error': str(e)})
             
         except Exception as e:
-            response = json.dumps({
-                'success': False,
-                'error': str(e)
-            }, ensure_ascii=False)
-            
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(response.encode('utf-8'))
+            self.send_json(500, {'success': False, 'error': str(e)})
     
     def send_api_import(self):
-        """从 Excel 导入数据"""
+        """从 Excel 导入数据到服务器（进程内调用同步库）"""
         try:
-            import subprocess
-            
-            # 调用同步脚本
-            result = subprocess.run(
-                ['python', 'sync_finance_data.py'],
-                input='1\n',
-                capture_output=True,
-                text=True,
-                timeout=30,
-                cwd=os.getcwd()
-            )
-            
-            if result.returncode == 0:
-                # 读取更新后的数据
-                data = read_data()
-                response = json.dumps({
+            from sync_finance_data import SyncError
+            try:
+                with sync_lock, metrics.timed('excel_import'):
+                    sync = get_sync()
+                    sync.backup_excel()
+                    data = sync.read_excel_data()
+                    save_data(data)
+                self.send_json(200, {
                     'success': True,
                     'message': 'Excel 导入成功',
                     'data': data
-                }, ensure_ascii=False)
-            else:
-                response = json.dumps({
-                    'success': False,
-                    'error': result.stderr or '导入失败'
-                }, ensure_ascii=False)
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(response.encode('utf-8'))
+                })
+            except SyncError as e:
+                self.send_json(200, {'success': False, 'error': str(e)})
             
         except Exception as e:
-            response = json.dumps({
-                'success': False,
-                'error': str(e)
-            }, ensure_ascii=False)
-            
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(response.encode('utf-8'))
+            self.send_json(500, {'success': False, 'error': str(e)})
+
+
+class BoundedThreadingHTTPServer(http.server.HTTPServer):
+    """多线程 HTTP 服务器：每个连接一个线程，同时连接数和同时处理的请求数都有上限
+    
+    慢请求（Excel 导出、网络差的手机）只占用一个工作名额，不会阻塞其他设备；
+    持久连接空闲时只占用连接名额，不占用工作名额。
+    """
+    
+    allow_reuse_address = True
+    
+    def __init__(self, server_address, handler_class, workers=WORKERS, max_connections=MAX_CONNECTIONS,
+                 max_streams=MAX_STREAMS):
+        super().__init__(server_address, handler_class)
+        # 变更推送连接由各自的线程负责，请求处理结束后不关闭
+        self.streams = threading.BoundedSemaphore(max_streams)
+        self._detached = set()
+        self._detached_lock = threading.Lock()
+        self.workers = threading.BoundedSemaphore(workers)
+        self.slots = threading.BoundedSemaphore(max(workers, max_connections))
+    
+    def process_request(self, request, client_address):
+        """为连接启动一个线程；连接数已满时直接返回 503"""
+        if not self.slots.acquire(blocking=False):
+            self.reject_request(request)
+            return
+        threading.Thread(target=self.process_request_thread, args=(request, client_address),
+                         name='finance-http', daemon=True).start()
+    
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+    
+    def start_stream(self, request, last_event_id):
+        """在单独的线程中向连接推送数据变更，直到连接断开"""
+        with self._detached_lock:
+            self._detached.add(request)
+        threading.Thread(target=self.stream_events, args=(request, last_event_id),
+                         name='finance-events', daemon=True).start()
+    
+    def stream_events(self, request, last_event_id):
+        try:
+            for text in event_stream(store, last_event_id):
+                request.sendall(text.encode('utf-8'))
+        except OSError:
+            pass
+        finally:
+            self.streams.release()
+            super().shutdown_request(request)
+    
+    def shutdown_request(self, request):
+        with self._detached_lock:
+            if request in self._detached:
+                self._detached.discard(request)
+                return
+        super().shutdown_request(request)
+    
+    def reject_request(self, request):
+        try:
+            request.sendall(
+                b'HTTP/1.1 503 Service Unavailable\r\n'
+                b'Retry-After: 1\r\n'
+                b'Content-Length: 0\r\n'
+                b'Connection: close\r\n\r\n'
+            )
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+
+_sync = None
+
+
+def get_sync():
+    """返回进程内共享的 FinanceDataSync 实例（首次调用时才导入 openpyxl 等依赖）"""
+    global _sync
+    if _sync is None:
+        from sync_finance_data import FinanceDataSync
+        _sync = FinanceDataSync(quiet=True)
+    return _sync
 
 
 def read_data():
-    """读取数据文件"""
-    try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except:
-        pass
-    
-    # 返回默认数据
-    return {
-        'deposit': [],
-        'loan': [],
-        'tax': [],
-        'tfsa': [],
-        'education': [],
-        'expense': []
-    }
+    """读取当前数据（浅拷贝，记录对象与仓库共享，调用方不要修改）"""
+    with metrics.timed('read_data'):
+        return store.copy()
 
 
-def save_data(data):
-    """保存数据到文件"""
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def save_data(data, if_match=None):
+    """整体保存数据（先更新内存，后台线程稍后写回），返回本次变更"""
+    with metrics.timed('save_data'):
+        return store.replace(data, if_match)
 
 
 def get_local_ip():
@@ -407,15 +514,41 @@ def get_local_ip():
 
 def main():
     """启动服务器"""
-    # 初始化数据文件
-    if not os.path.exists(DATA_FILE):
-        save_data(read_data())
+    parser = argparse.ArgumentParser(description='家庭财务管理系统 - Web 服务器')
+    parser.add_argument('--port', type=int, default=PORT, help=f'端口（默认 {PORT}）')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help=f'同时处理的请求数（默认 {WORKERS}）')
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS,
+                        help=f'最大同时连接数（默认 {MAX_CONNECTIONS}）')
+    parser.add_argument('--keep-alive-timeout', type=int, default=KEEP_ALIVE_TIMEOUT,
+                        help=f'空闲连接保持秒数（默认 {KEEP_ALIVE_TIMEOUT}）')
+    parser.add_argument('--max-streams', type=int, default=MAX_STREAMS,
+                        help=f'最大变更推送连接数（默认 {MAX_STREAMS}）')
+    parser.add_argument('--storage', choices=sorted(BACKENDS), default=STORAGE,
+                        help=f'数据存储方式（默认 {STORAGE}，可用环境变量 FINANCE_STORAGE 设置）')
+    args = parser.parse_args()
+    FinanceHTTPRequestHandler.timeout = args.keep_alive_timeout
+    
+    global store
+    if args.storage != store.storage:
+        store = FinanceStore(DATA_FILE, storage=args.storage)
+    
+    # 加载数据（数据文件不存在时会自动创建）
+    read_data()
     
     # 检查 HTML 文件
     if not os.path.exists(HTML_FILE):
         print(f"✗ 错误: 找不到网页文件 {HTML_FILE}")
         return
     
+    # 预先加载同步库，Excel 导入导出请求无需再等待模块导入
+    try:
+        from sync_finance_data import preload_excel
+        get_sync()
+        preload_excel()
+    except ImportError as e:
+        print(f"⚠ 未安装 Excel 同步依赖（{e.name}），Excel 导入导出功能不可用")
+    
     # 获取本机 IP
     local_ip = get_local_ip()
     
@@ -423,23 +556,32 @@ def main():
     print("家庭财务管理系统 - Web 服务器")
     print("="*70)
     print(f"\n✓ 服务器启动成功！")
-    print(f"\n📱 手机访问地址: http://{local_ip}:{PORT}")
-    print(f"💻 电脑访问地址: http://localhost:{PORT}")
+    print(f"\n📱 手机访问地址: http://{local_ip}:{args.port}")
+    print(f"💻 电脑访问地址: http://localhost:{args.port}")
     print(f"\n⚠️  重要提示:")
     print(f"   1. 确保手机和电脑在同一 WiFi 网络")
     print(f"   2. 不要关闭此窗口，关闭窗口后服务器停止运行")
-    print(f"   3. 数据自动保存到服务器，所有设备实时同步")
+    print(f"   3. 数据自动保存到服务器，其他设备的修改会立即推送到页面")
     print(f"   4. 页面右上角有'刷新数据'按钮，点击可手动刷新")
     print("\n" + "="*70)
     
     # 启动服务器
-    with socketserver.TCPServer(("", PORT), FinanceHTTPRequestHandler) as httpd:
-        print(f"\n🚀 服务器正在运行... (按 Ctrl+C 停止)\n")
+    server = BoundedThreadingHTTPServer(
+        ("", args.port),
+        FinanceHTTPRequestHandler,
+        workers=args.workers,
+        max_connections=args.max_connections,
+        max_streams=args.max_streams
+    )
+    with server as httpd:
+        print(f"\n🚀 服务器正在运行（同时处理 {args.workers} 个请求）... (按 Ctrl+C 停止)\n")
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
             print("\n\n✓ 服务器已停止")
             print("感谢使用家庭财务管理系统！")
+        finally:
+            store.close()
 
 
 if __name__ == "__main__":
@@ -2,26 +2,320 @@
 家庭财务管理系统 - Excel 与网页同步工具
 
 功能：
-1. 从 Excel 读取数据并同步到网页
+1. 从 Excel 读取数据并同步到网页（默认写入服务器数据文件 finance_data.json）
 2. 从网页数据导出回 Excel
 3. 支持增量同步和全量同步
 4. 自动备份原始数据
+5. 监视模式：Excel 保存后自动增量同步（python sync_finance_data.py --watch）
 """
 
-import pandas as pd
-import openpyxl
-from openpyxl import load_workbook
+import argparse
+import bisect
+import difflib
 import json
 import os
-from datetime import datetime
-import shutil
+import sys
+import hashlib
+import importlib
+import threading
+import zipfile
+import time
+from datetime import datetime, date
+from copy import copy
+
+from backup_store import BackupStore
+
+# openpyxl 和进程池只在实际读写 Excel 时才导入，保证被服务器、定时任务导入时启动足够快
+
+
+def preload_excel():
+    """预先导入 openpyxl（服务器启动时调用），之后的 Excel 导入导出无需再等待模块导入
+
+    未安装 openpyxl 时抛出 ImportError。
+    """
+    importlib.import_module('openpyxl')
+
+
+# 列类型定义（Excel 列名 -> 类型），读取时的类型转换与导出时的单元格格式共用这一份定义
+BOOL_HEADERS = frozenset(['是否有支撑材料', '是否分期'])
+MONEY_HEADERS = frozenset([
+    '入金金额', '还款金额', '账户余额', '金额',
+    '申报收入', '报税金额', '实际缴税金额',
+    '年度投资收益', '年度取款', '年度存入', '年度支取'
+])
+DATE_HEADERS = frozenset(['入金时间', '还款日期', '报税日期', '开户日期', '交易日期'])
+
+# 增量导出时没有唯一行可对齐的区段，逐行匹配的规模上限（旧行数 × 新行数），超过时按位置比较
+ROW_MATCH_LIMIT = 250000
+
+MONEY_FORMAT = '#,##0.00'
+DATE_FORMAT = 'yyyy-mm-dd'
+
+
+def column_type(header):
+    """返回列类型：'bool'、'money'、'date' 或 'text'"""
+    if header in BOOL_HEADERS:
+        return 'bool'
+    if header in MONEY_HEADERS:
+        return 'money'
+    if header in DATE_HEADERS:
+        return 'date'
+    return 'text'
+
+
+def _to_bool(value):
+    return bool(value)
+
+
+def _to_money(value):
+    if not value:
+        return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _to_date_text(value):
+    """Excel 日期单元格 -> ISO 字符串（便于 JSON 序列化和按日期排序）"""
+    if isinstance(value, datetime):
+        if value.time() == datetime.min.time():
+            return value.date().isoformat()
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _from_date_text(value):
+    """ISO 日期字符串 -> datetime，写回 Excel 时恢复为日期单元格"""
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+
+# 导出时各列类型使用的共享命名样式
+EXPORT_STYLES = {
+    'bool': 'finance_bool',
+    'money': 'finance_money',
+    'date': 'finance_date'
+}
+
+
+# 读取时的转换函数（None 表示保留原值）
+READ_CONVERTERS = {
+    'bool': _to_bool,
+    'money': _to_money,
+    'date': _to_date_text,
+    'text': None
+}
+
+
+def compile_sheet_schema(headers, field_map):
+    """把表头和字段映射编译为 (列索引, 字段名, 转换函数) 元组，每个工作表只需编译一次"""
+    return tuple(
+        (col_idx, field_map[header], READ_CONVERTERS[column_type(header)])
+        for col_idx, header in enumerate(headers)
+        if header in field_map
+    )
+
+
+def convert_row(schema, row):
+    """按编译好的 schema 一次遍历把一行单元格值转换为记录字典
+
+    只读模式下行尾的空单元格可能不出现在 row 中，按空值补齐，
+    与完整加载工作簿时的结果保持一致。
+    """
+    if schema and len(row) <= schema[-1][0]:
+        row = tuple(row) + (None,) * (schema[-1][0] + 1 - len(row))
+    return {
+        field: (convert(row[col_idx]) if convert else row[col_idx])
+        for col_idx, field, convert in schema
+    }
+
+
+class SyncError(Exception):
+    """同步失败的基类"""
+
+
+class SourceNotFoundError(SyncError):
+    """Excel / 网页文件或备份不存在"""
+
+
+class SyncReadError(SyncError):
+    """读取或解析数据失败"""
+
+
+class SyncWriteError(SyncError):
+    """写入目标文件失败"""
+
+
+def record_fingerprint(record):
+    """记录内容哈希（与字段顺序无关，空值字段和服务器分配的 id 不参与计算）"""
+    content = {k: v for k, v in record.items() if v is not None and k != 'id'}
+    payload = json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def diff_fingerprints(old, new):
+    """按内容匹配两组行哈希，找出真正新增、删除和修改的行
+
+    返回 {'changed': [...], 'inserted': [...], 'deleted': [...]}，均为从 0 开始的行序号；
+    deleted 为旧序号，changed 和 inserted 为新序号。中间插入或删除一行时其后的行不算修改。
+    """
+    delta = {'changed': [], 'inserted': [], 'deleted': []}
+    for i1, i2, j1, j2 in _diff_hunks(old, new):
+        # 同一段中一一对应的行算修改，多出的行算新增或删除
+        paired = min(i2 - i1, j2 - j1)
+        delta['changed'].extend(range(j1, j1 + paired))
+        delta['inserted'].extend(range(j1 + paired, j2))
+        delta['deleted'].extend(range(i1 + paired, i2))
+    return delta
+
+
+def _diff_hunks(old, new):
+    """不相同的区段 [(旧起, 旧止, 新起, 新止), ...]，按位置排序
+
+    patience diff：去掉首尾相同的行后，以两边都只出现一次的行为锚点对齐，再分别处理锚点之间的区段；
+    没有锚点的小区段用 SequenceMatcher 匹配，过大的区段按位置逐行比较（避免重复行很多时耗时成平方增长）。
+    """
+    hunks = []
+    stack = [(0, len(old), 0, len(new))]
+    while stack:
+        i1, i2, j1, j2 = stack.pop()
+        while i1 < i2 and j1 < j2 and old[i1] == new[j1]:
+            i1 += 1
+            j1 += 1
+        while i1 < i2 and j1 < j2 and old[i2 - 1] == new[j2 - 1]:
+            i2 -= 1
+            j2 -= 1
+        if i1 == i2 and j1 == j2:
+            continue
+        if i1 == i2 or j1 == j2:
+            hunks.append((i1, i2, j1, j2))
+            continue
+        anchors = _unique_anchors(old, new, i1, i2, j1, j2)
+        if anchors:
+            for i, j in anchors:
+                stack.append((i1, i, j1, j))
+                i1, j1 = i + 1, j + 1
+            stack.append((i1, i2, j1, j2))
+        elif (i2 - i1) * (j2 - j1) <= ROW_MATCH_LIMIT:
+            matcher = difflib.SequenceMatcher(None, old[i1:i2], new[j1:j2], autojunk=False)
+            hunks.extend((i1 + a1, i1 + a2, j1 + b1, j1 + b2)
+                         for tag, a1, a2, b1, b2 in matcher.get_opcodes() if tag != 'equal')
+        else:
+            hunks.append((i1, i2, j1, j2))
+    hunks.sort()
+    return hunks
+
+
+def _unique_anchors(old, new, i1, i2, j1, j2):
+    """区段内两边都只出现一次的行，取顺序一致的最多一组 [(旧序号, 新序号), ...]（最长递增子序列）"""
+    seen = {}
+    for i in range(i1, i2):
+        entry = seen.setdefault(old[i], [0, i, 0, 0])
+        entry[0] += 1
+    for j in range(j1, j2):
+        entry = seen.get(new[j])
+        if entry is not None:
+            entry[2] += 1
+            entry[3] = j
+    pairs = sorted((entry[1], entry[3]) for entry in seen.values() if entry[0] == 1 and entry[2] == 1)
+
+    tails, tail_js, previous = [], [], [None] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        length = bisect.bisect_left(tail_js, j)
+        if length:
+            previous[index] = tails[length - 1]
+        if length == len(tails):
+            tails.append(index)
+            tail_js.append(j)
+        else:
+            tails[length] = index
+            tail_js[length] = j
+    anchors = []
+    index = tails[-1] if tails else None
+    while index is not None:
+        anchors.append(pairs[index])
+        index = previous[index]
+    return anchors[::-1]
+
+
+def _row_runs(indexes):
+    """把递增的行序号合并为连续区间 [(起始序号, 行数), ...]"""
+    runs = []
+    for index in indexes:
+        if runs and runs[-1][0] + runs[-1][1] == index:
+            runs[-1][1] += 1
+        else:
+            runs.append([index, 1])
+    return runs
+
+
+FINANCE_DATA_MARKER = 'let financeData = '
+
+
+def find_finance_data(html_content):
+    """定位网页中内嵌的 financeData 对象，返回 (起始位置, 结束位置, 数据)
+
+    用 JSON 解码器确定对象的结束位置，数据中含有 "}" 或 "};" 时也能正确定位。
+    """
+    start = html_content.find(FINANCE_DATA_MARKER)
+    if start < 0:
+        raise ValueError("网页中找不到 financeData 初始化代码")
+    start += len(FINANCE_DATA_MARKER)
+    data, end = json.JSONDecoder().raw_decode(html_content, start)
+    return start, end, data
+
+
+def write_json_atomic(path, data):
+    """以紧凑格式原子写入 JSON：先写临时文件并 fsync，再替换目标文件"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    write_bytes_atomic(path, payload.encode('utf-8'))
+
+
+def write_bytes_atomic(path, payload):
+    """原子写入文件内容：先写临时文件并 fsync，再替换目标文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 
 class FinanceDataSync:
-    def __init__(self, excel_path='家庭财务管理系统.xlsx', html_path='family_finance_web.html'):
+    """Excel 与网页数据同步
+    
+    可以作为库在进程内调用：同步方法返回结果字典，失败时抛出 SyncError 的子类。
+    quiet=True 时不打印进度信息（例如在 Web 服务器中使用）。
+    
+    网页端数据默认读写服务器数据文件 data_path（target / source 为 'json'），
+    也可以选择 'html'，直接读写内嵌在网页文件中的 financeData。
+    sheets 为数据类型列表（如 ['expense', 'deposit']）时只同步这些工作表。
+    """
+    
+    def __init__(self, excel_path='家庭财务管理系统.xlsx', html_path='family_finance_web.html',
+                 backup_dir=None, backup_retention=None, quiet=False, data_path='finance_data.json',
+                 sheets=None):
         self.excel_path = excel_path
         self.html_path = html_path
-        self.backup_path = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        self.data_path = data_path
+        self.quiet = quiet
+        # 备份仓库默认放在 Excel 所在目录的 backups/ 下
+        backup_dir = backup_dir or os.path.join(os.path.dirname(os.path.abspath(excel_path)), 'backups')
+        self.backup_store = BackupStore(backup_dir, retention=backup_retention)
+        self.manifest_path = os.path.splitext(excel_path)[0] + '.sync-manifest.json'
         
         # 工作表映射
         self.sheet_mapping = {
@@ -99,22 +393,92 @@ class FinanceDataSync:
                 '分期数': 'installments'
             }
         }
+        
+        # 只同步指定的工作表
+        self.partial = bool(sheets)
+        if sheets:
+            unknown = set(sheets) - set(self.sheet_mapping)
+            if unknown:
+                raise ValueError(f"未知的数据类型: {', '.join(sorted(unknown))}")
+            self.sheet_mapping = {k: v for k, v in self.sheet_mapping.items() if k in sheets}
+    
+    def _log(self, message=''):
+        if not self.quiet:
+            print(message)
     
     def backup_excel(self):
-        """备份 Excel 文件"""
+        """备份 Excel 文件（内容未变化时不重复备份）"""
         if os.path.exists(self.excel_path):
-            shutil.copy2(self.excel_path, self.backup_path)
-            print(f"✓ 已备份原始文件: {self.backup_path}")
+            entry = self.backup_store.backup(self.excel_path)
+            if entry:
+                self._log(f"✓ 已备份原始文件: {entry['id']}")
+            else:
+                self._log(f"✓ 文件内容与上次备份相同，无需重复备份")
             return True
         return False
     
-    def read_excel_data(self):
-        """从 Excel 读取所有工作表数据"""
+    def restore_excel(self, backup_id=None):
+        """从备份恢复 Excel 文件（backup_id 为空时恢复最近一份），返回备份条目"""
+        try:
+            entry = self.backup_store.restore(self.excel_path, backup_id)
+        except FileNotFoundError as e:
+            raise SourceNotFoundError(str(e)) from e
+        self._log(f"✓ 已从备份恢复: {entry['id']}")
+        return entry
+    
+    def _iter_sheet_records(self, ws, field_map):
+        """逐行生成单个工作表的记录（从第4行开始，跳过公式行和说明行）"""
+        rows = ws.iter_rows(values_only=True)
+        
+        # 获取表头并编译列转换表
+        first_row = next(rows, ())
+        headers = [value for value in first_row if value]
+        schema = compile_sheet_schema(headers, field_map)
+        
+        for row_idx, row in enumerate(rows, start=2):
+            if row_idx < 4 or not any(row):
+                continue
+            
+            record = convert_row(schema, row)
+            if record:
+                yield record
+    
+    def iter_excel_sheets(self):
+        """以只读流式模式逐个工作表读取 Excel
+        
+        生成 (数据类型, 工作表名, 记录生成器)。单元格按行解析后即可释放，
+        峰值内存不随行数增长；请在取下一个工作表前消费完当前的记录生成器。
+        """
+        from openpyxl import load_workbook
+        
+        wb = load_workbook(self.excel_path, read_only=True)
+        try:
+            for key, sheet_name in self.sheet_mapping.items():
+                if sheet_name not in wb.sheetnames:
+                    self._log(f"⚠ 工作表不存在: {sheet_name}")
+                    continue
+                
+                yield key, sheet_name, self._iter_sheet_records(wb[sheet_name], self.field_mapping[key])
+        finally:
+            wb.close()
+    
+    def iter_excel_records(self):
+        """流式读取所有工作表，逐条生成 (数据类型, 记录)"""
+        for key, sheet_name, records in self.iter_excel_sheets():
+            for record in records:
+                yield key, record
+    
+    def read_excel_data(self, streaming=True, workers=None):
+        """从 Excel 读取所有工作表数据
+        
+        streaming=True 时使用只读流式解析；streaming=False 时完整加载工作簿
+        （包括样式），两种方式返回的数据一致。
+        workers 大于 1 时在进程池中并行解析各工作表（每个工作表一个进程）。
+        """
         if not os.path.exists(self.excel_path):
-            print(f"✗ Excel 文件不存在: {self.excel_path}")
-            return None
+            raise SourceNotFoundError(f"Excel 文件不存在: {self.excel_path}")
         
-        print(f"正在读取 Excel 文件: {self.excel_path}")
+        self._log(f"正在读取 Excel 文件: {self.excel_path}")
         
         data = {
             'deposit': [],
@@ -126,64 +490,66 @@ class FinanceDataSync:
         }
         
         try:
+            if workers and workers > 1:
+                return self._read_excel_parallel(data, workers)
+            
+            if streaming:
+                for key, sheet_name, records in self.iter_excel_sheets():
+                    data[key].extend(records)
+                    self._log(f"✓ 读取 {sheet_name}: {len(data[key])} 条记录")
+                return data
+            
+            from openpyxl import load_workbook
+            
             wb = load_workbook(self.excel_path)
             
             for key, sheet_name in self.sheet_mapping.items():
                 if sheet_name not in wb.sheetnames:
-                    print(f"⚠ 工作表不存在: {sheet_name}")
+                    self._log(f"⚠ 工作表不存在: {sheet_name}")
                     continue
                 
-                ws = wb[sheet_name]
-                field_map = self.field_mapping[key]
-                
-                # 获取表头
-                headers = []
-                for cell in ws[1]:
-                    if cell.value:
-                        headers.append(cell.value)
-                
-                # 读取数据（从第4行开始，跳过公式行和说明行）
-                for row_idx, row in enumerate(ws.iter_rows(min_row=4, values_only=True), start=4):
-                    if not any(row):
-                        continue
-                    
-                    record = {}
-                    for col_idx, header in enumerate(headers):
-                        if col_idx < len(row) and header in field_map:
-                            value = row[col_idx]
-                            # 处理布尔值
-                            if header in ['是否有支撑材料', '是否分期']:
-                                value = bool(value) if value else False
-                            # 处理金额
-                            elif header in ['入金金额', '还款金额', '账户余额', '金额', 
-                                          '申报收入', '报税金额', '实际缴税金额',
-                                          '年度投资收益', '年度取款', '年度存入', '年度支取']:
-                                try:
-                                    value = float(value) if value else 0.0
-                                except:
-                                    value = 0.0
-                            
-                            record[field_map[header]] = value
-                    
-                    if record:
-                        data[key].append(record)
-                
-                print(f"✓ 读取 {sheet_name}: {len(data[key])} 条记录")
+                data[key].extend(self._iter_sheet_records(wb[sheet_name], self.field_mapping[key]))
+                self._log(f"✓ 读取 {sheet_name}: {len(data[key])} 条记录")
             
             wb.close()
             return data
             
         except Exception as e:
-            print(f"✗ 读取 Excel 失败: {str(e)}")
-            return None
+            raise SyncReadError(f"读取 Excel 失败: {str(e)}") from e
+    
+    def _read_excel_parallel(self, data, workers):
+        """在进程池中并行读取各工作表，按 sheet_mapping 顺序合并结果"""
+        from concurrent.futures import ProcessPoolExecutor
+        from openpyxl import load_workbook
+        
+        wb = load_workbook(self.excel_path, read_only=True)
+        sheetnames = wb.sheetnames
+        wb.close()
+        
+        jobs = []
+        for key, sheet_name in self.sheet_mapping.items():
+            if sheet_name not in sheetnames:
+                self._log(f"⚠ 工作表不存在: {sheet_name}")
+                continue
+            jobs.append((key, sheet_name))
+        
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs) or 1)) as pool:
+            futures = [
+                pool.submit(_read_sheet_worker, self.excel_path, sheet_name, self.field_mapping[key])
+                for key, sheet_name in jobs
+            ]
+            for (key, sheet_name), future in zip(jobs, futures):
+                data[key] = future.result()
+                self._log(f"✓ 读取 {sheet_name}: {len(data[key])} 条记录")
+        
+        return data
     
     def write_html_data(self, data):
         """将数据写入 HTML 文件"""
         if not os.path.exists(self.html_path):
-            print(f"✗ HTML 文件不存在: {self.html_path}")
-            return False
+            raise SourceNotFoundError(f"HTML 文件不存在: {self.html_path}")
         
-        print(f"正在同步数据到网页: {self.html_path}")
+        self._log(f"正在同步数据到网页: {self.html_path}")
         
         try:
             # 读取原 HTML
@@ -194,47 +560,117 @@ class FinanceDataSync:
             data_json = json.dumps(data, ensure_ascii=False, indent=2)
             
             # 查找并替换初始化数据
-            old_pattern = r'let financeData = \{[^}]*\};'
-            new_init = f'let financeData = {data_json};'
-            
-            import re
-            new_html = re.sub(old_pattern, new_init, html_content, count=1, flags=re.DOTALL)
+            start, end, _ = find_finance_data(html_content)
+            new_html = html_content[:start] + data_json + html_content[end:]
             
             # 写回文件
             with open(self.html_path, 'w', encoding='utf-8') as f:
                 f.write(new_html)
             
-            print(f"✓ 数据已同步到网页")
-            print(f"  - 账户入金: {len(data.get('deposit', []))} 条")
-            print(f"  - 贷款还款: {len(data.get('loan', []))} 条")
-            print(f"  - 报税记录: {len(data.get('tax', []))} 条")
-            print(f"  - 免税账户: {len(data.get('tfsa', []))} 条")
-            print(f"  - 教育账户: {len(data.get('education', []))} 条")
-            print(f"  - 收支跟踪: {len(data.get('expense', []))} 条")
+            self._log(f"✓ 数据已同步到网页")
+            self._log(f"  - 账户入金: {len(data.get('deposit', []))} 条")
+            self._log(f"  - 贷款还款: {len(data.get('loan', []))} 条")
+            self._log(f"  - 报税记录: {len(data.get('tax', []))} 条")
+            self._log(f"  - 免税账户: {len(data.get('tfsa', []))} 条")
+            self._log(f"  - 教育账户: {len(data.get('education', []))} 条")
+            self._log(f"  - 收支跟踪: {len(data.get('expense', []))} 条")
             
             return True
             
         except Exception as e:
-            print(f"✗ 同步到网页失败: {str(e)}")
-            return False
+            raise SyncWriteError(f"同步到网页失败: {str(e)}") from e
+    
+    def write_json_data(self, data):
+        """将数据原子写入服务器数据文件（紧凑格式，网页不再需要内嵌数据）"""
+        self._log(f"正在同步数据到服务器数据文件: {self.data_path}")
+        
+        # 只同步部分工作表时，保留服务器数据中其它类型的记录
+        if self.partial:
+            try:
+                merged = self.read_json_data()
+            except SourceNotFoundError:
+                merged = None
+            if merged is not None:
+                merged.update({key: data.get(key, []) for key in self.sheet_mapping})
+                data = merged
+        
+        try:
+            write_json_atomic(self.data_path, data)
+        except Exception as e:
+            raise SyncWriteError(f"写入数据文件失败: {str(e)}") from e
+        
+        self._log(f"✓ 数据已同步到服务器数据文件")
+        for key, sheet_name in self.sheet_mapping.items():
+            self._log(f"  - {sheet_name}: {len(data.get(key, []))} 条")
+        return True
+    
+    def read_json_data(self):
+        """读取服务器数据文件
+        
+        包括服务器已保存到修改日志或 SQLite 数据库、尚未写入数据文件的修改（见 read_current_data），
+        只同步部分工作表时其它类型的记录以此为准，不会用过时的数据文件覆盖服务器的修改。
+        """
+        try:
+            from finance_store import read_current_data
+            data = read_current_data(self.data_path)
+        except Exception as e:
+            raise SyncReadError(f"读取数据文件失败: {str(e)}") from e
+        if data is None:
+            raise SourceNotFoundError(f"数据文件不存在: {self.data_path}")
+        return data
+    
+    def _export_plan(self, headers, field_map):
+        """为一个工作表预先计算导出列：(字段名, 列号, 写入转换函数, 命名样式)"""
+        plan = []
+        for col_idx, header in enumerate(headers, start=1):  # Excel 列从 1 开始
+            if header not in field_map:
+                continue
+            kind = column_type(header)
+            convert = _from_date_text if kind == 'date' else None
+            plan.append((field_map[header], col_idx, convert, EXPORT_STYLES.get(kind)))
+        return plan
+    
+    def _add_named_styles(self, wb):
+        """在工作簿中注册导出用的共享命名样式（每个工作簿只注册一次）"""
+        from openpyxl.styles import Alignment, NamedStyle
+        
+        styles = [
+            NamedStyle(name='finance_bool', alignment=Alignment(horizontal='center')),
+            NamedStyle(name='finance_money', number_format=MONEY_FORMAT),
+            NamedStyle(name='finance_date', number_format=DATE_FORMAT)
+        ]
+        for style in styles:
+            if style.name not in wb.named_styles:
+                wb.add_named_style(style)
     
-    def export_to_excel(self, data):
-        """将数据导出回 Excel"""
-        print(f"正在导出数据到 Excel: {self.excel_path}")
+    def export_to_excel(self, data, write_only=False, output_path=None):
+        """将数据导出回 Excel
+        
+        默认在原工作簿上整块清空数据区（第4行起）后一次性写入新数据；
+        write_only=True 时改为以 write-only 模式生成新工作簿，只复制各工作表
+        前3行模板（表头、公式、说明）的值和样式，列宽、合并单元格、超链接
+        不会保留，适合大批量导出。output_path 默认为原 Excel 路径。
+        """
+        output_path = output_path or self.excel_path
+        self._log(f"正在导出数据到 Excel: {output_path}")
         
         try:
+            if write_only:
+                self._export_write_only(data, output_path)
+                self._log(f"✓ 数据已导出到 Excel")
+                return True
+            
             # 加载现有工作簿
+            from openpyxl import load_workbook
+            
             wb = load_workbook(self.excel_path)
+            self._add_named_styles(wb)
             
             for key, sheet_name in self.sheet_mapping.items():
                 if sheet_name not in wb.sheetnames:
                     continue
                 
                 ws = wb[sheet_name]
-                field_map = self.field_mapping[key]
-                
-                # 反向映射：字段名 -> Excel 列名
-                reverse_map = {v: k for k, v in field_map.items()}
                 
                 # 获取表头
                 headers = []
@@ -242,105 +678,438 @@ class FinanceDataSync:
                     if cell.value:
                         headers.append(cell.value)
                 
-                # 获取列索引映射
-                col_indices = {}
-                for col_idx, header in enumerate(headers):
-                    col_indices[header] = col_idx + 1  # Excel 列从 1 开始
+                plan = self._export_plan(headers, self.field_mapping[key])
                 
-                # 清空原有数据（保留前3行：表头、公式、说明）
-                max_row = ws.max_row
-                if max_row > 3:
-                    for row_idx in range(max_row, 3, -1):
-                        ws.delete_rows(row_idx)
+                # 清空原有数据（保留前3行：表头、公式、说明），一次删除整个数据区
+                if ws.max_row > 3:
+                    ws.delete_rows(4, ws.max_row - 3)
                 
                 # 写入新数据（从第4行开始）
                 records = data.get(key, [])
-                for record_idx, record in enumerate(records, start=4):
-                    for field_name, value in record.items():
-                        if field_name in reverse_map:
-                            header = reverse_map[field_name]
-                            if header in col_indices:
-                                cell = ws.cell(row=record_idx, column=col_indices[header])
-                                cell.value = value
-                                
-                                # 设置格式
-                                if header in ['是否有支撑材料', '是否分期']:
-                                    cell.alignment = openpyxl.styles.Alignment(horizontal='center')
-                                elif header in ['入金金额', '还款金额', '账户余额', '金额',
-                                              '申报收入', '报税金额', '实际缴税金额']:
-                                    cell.number_format = '#,##0.00'
+                for row_idx, record in enumerate(records, start=4):
+                    self._write_record_row(ws, row_idx, record, plan)
             
             # 保存
+            wb.save(output_path)
+            wb.close()
+            
+            self._log(f"✓ 数据已导出到 Excel")
+            return True
+            
+        except Exception as e:
+            raise SyncWriteError(f"导出到 Excel 失败: {str(e)}") from e
+    
+    def _write_record_row(self, ws, row_idx, record, plan, clear=False):
+        """按导出列计划写入一行记录；clear=True 时先清空记录中没有的列"""
+        for field_name, col_idx, convert, style in plan:
+            if field_name not in record:
+                if clear:
+                    ws.cell(row=row_idx, column=col_idx).value = None
+                continue
+            value = record[field_name]
+            if convert:
+                value = convert(value)
+            cell = ws.cell(row=row_idx, column=col_idx, value=value)
+            if style and (style != 'finance_date' or isinstance(value, datetime)):
+                cell.style = style
+    
+    def export_delta_to_excel(self, data, deltas):
+        """只把有变化的行写回 Excel
+        
+        deltas 为 {数据类型: diff_fingerprints 结果}：先删除被删除的行，再在新位置插入空行，
+        然后逐行写入变化和新增的行，其余行保持不动。
+        """
+        self._log(f"正在增量导出数据到 Excel: {self.excel_path}")
+        
+        try:
+            from openpyxl import load_workbook
+            
+            wb = load_workbook(self.excel_path)
+            self._add_named_styles(wb)
+            
+            for key, delta in deltas.items():
+                sheet_name = self.sheet_mapping[key]
+                if sheet_name not in wb.sheetnames:
+                    continue
+                
+                ws = wb[sheet_name]
+                headers = [cell.value for cell in ws[1] if cell.value]
+                plan = self._export_plan(headers, self.field_mapping[key])
+                records = data.get(key, [])
+                
+                # 从后往前删除，前面的行号不受影响；删除后剩下的行与新数据中非新增的行顺序一致，
+                # 再按新序号从前往后插入空行
+                for start, amount in reversed(_row_runs(delta['deleted'])):
+                    ws.delete_rows(start + 4, amount)
+                for start, amount in _row_runs(delta['inserted']):
+                    ws.insert_rows(start + 4, amount)
+                
+                for idx in delta['changed'] + delta['inserted']:
+                    self._write_record_row(ws, idx + 4, records[idx], plan, clear=True)
+            
             wb.save(self.excel_path)
             wb.close()
             
-            print(f"✓ 数据已导出到 Excel")
+            self._log(f"✓ 数据已增量导出到 Excel")
             return True
             
         except Exception as e:
-            print(f"✗ 导出到 Excel 失败: {str(e)}")
-            return False
+            raise SyncWriteError(f"增量导出到 Excel 失败: {str(e)}") from e
     
-    def excel_to_web(self):
-        """Excel -> 网页同步"""
-        print("\n" + "="*50)
-        print("开始 Excel -> 网页 同步")
-        print("="*50)
+    def _export_write_only(self, data, output_path):
+        """以 write-only 模式生成新工作簿：模板前3行原样复制，其后逐行追加数据"""
+        from openpyxl import Workbook, load_workbook
+        from openpyxl.cell import WriteOnlyCell
         
-        self.backup_excel()
-        data = self.read_excel_data()
+        sheet_keys = {sheet_name: key for key, sheet_name in self.sheet_mapping.items()}
         
-        if data:
-            self.write_html_data(data)
-            print("\n✓ Excel -> 网页 同步完成")
-        else:
-            print("\n✗ Excel -> 网页 同步失败")
+        src = load_workbook(self.excel_path, read_only=True)
+        out = Workbook(write_only=True)
+        self._add_named_styles(out)
+        
+        try:
+            for sheet_name in src.sheetnames:
+                ws_src = src[sheet_name]
+                ws_out = out.create_sheet(title=sheet_name)
+                key = sheet_keys.get(sheet_name)
+                
+                # 非数据工作表（如仪表盘）整表复制
+                if key is None:
+                    for row in ws_src.iter_rows():
+                        ws_out.append(_copy_template_row(ws_out, row))
+                    continue
+                
+                ws_out.freeze_panes = 'A2'
+                template_rows = list(ws_src.iter_rows(max_row=3))
+                headers = [cell.value for cell in template_rows[0] if cell.value] if template_rows else []
+                for row in template_rows:
+                    ws_out.append(_copy_template_row(ws_out, row))
+                
+                plan = self._export_plan(headers, self.field_mapping[key])
+                width = len(headers)
+                for record in data.get(key, []):
+                    values = [None] * width
+                    for field_name, col_idx, convert, style in plan:
+                        if field_name not in record:
+                            continue
+                        value = record[field_name]
+                        if convert:
+                            value = convert(value)
+                        if style and (style != 'finance_date' or isinstance(value, datetime)):
+                            cell = WriteOnlyCell(ws_out, value=value)
+                            cell.style = style
+                            value = cell
+                        values[col_idx - 1] = value
+                    ws_out.append(values)
+            
+            out.save(output_path)
+        finally:
+            src.close()
+    
+    def _excel_stat(self):
+        """Excel 文件的修改时间和大小，用于判断文件是否在上次同步后被改动"""
+        stat = os.stat(self.excel_path)
+        return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
     
-    def web_to_excel(self):
-        """网页 -> Excel 同步"""
-        print("\n" + "="*50)
-        print("开始 网页 -> Excel 同步")
-        print("="*50)
+    def load_manifest(self):
+        """读取增量同步清单（上次同步时每个工作表的行哈希），不存在时返回 None"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def save_manifest(self, data, excel_stat=None):
+        """记录本次同步后的行哈希和 Excel 文件状态
         
-        self.backup_excel()
+        excel_stat 应为读取 Excel 之前取得的文件状态，这样读取期间 Excel
+        再次被保存时，下一次增量同步仍能发现变化。
+        """
+        previous = self.load_manifest() or {}
+        sheets = previous.get('sheets', {}) if self.partial else {}
+        sheets.update({
+            key: [record_fingerprint(record) for record in data.get(key, [])]
+            for key in self.sheet_mapping
+        })
+        # 只同步了部分工作表时，其它工作表的变化尚未同步，不能更新文件状态
+        if self.partial:
+            excel_stat = previous.get('excel')
+        else:
+            excel_stat = excel_stat or self._excel_stat()
+        manifest = {
+            'excel': excel_stat,
+            'sheets': sheets
+        }
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+    
+    def compute_deltas(self, manifest, data):
+        """对比清单和当前数据，返回有变化的工作表 {数据类型: 行差异}"""
+        deltas = {}
+        for key in self.sheet_mapping:
+            old = manifest['sheets'].get(key, [])
+            new = [record_fingerprint(record) for record in data.get(key, [])]
+            delta = diff_fingerprints(old, new)
+            if delta['changed'] or delta['inserted'] or delta['deleted']:
+                deltas[key] = delta
+        return deltas
+    
+    def _print_deltas(self, deltas):
+        for key, delta in deltas.items():
+            self._log(f"  - {self.sheet_mapping[key]}: 新增 {len(delta['inserted'])} 条, "
+                  f"修改 {len(delta['changed'])} 条, 删除 {len(delta['deleted'])} 条")
+    
+    def read_html_data(self):
+        """从 HTML 文件中提取 financeData"""
+        if not os.path.exists(self.html_path):
+            raise SourceNotFoundError(f"HTML 文件不存在: {self.html_path}")
         
-        # 从 HTML 读取数据
         try:
             with open(self.html_path, 'r', encoding='utf-8') as f:
                 html_content = f.read()
             
             # 提取 financeData
-            import re
-            pattern = r'let financeData = (\{.*?\});'
-            match = re.search(pattern, html_content, re.DOTALL)
-            
-            if match:
-                data_json = match.group(1)
-                data = json.loads(data_json)
-                
-                if self.export_to_excel(data):
-                    print("\n✓ 网页 -> Excel 同步完成")
-                else:
-                    print("\n✗ 网页 -> Excel 同步失败")
-            else:
-                print("✗ 无法从网页提取数据")
+            _, _, data = find_finance_data(html_content)
+            return data
                 
         except Exception as e:
-            print(f"✗ 读取网页数据失败: {str(e)}")
+            raise SyncReadError(f"读取网页数据失败: {str(e)}") from e
+    
+    def _result(self, direction, status, data=None, deltas=None):
+        """同步结果：方向、状态（synced / unchanged）、各类型记录数和行差异"""
+        return {
+            'direction': direction,
+            'status': status,
+            'counts': {key: len(data.get(key, [])) for key in self.sheet_mapping} if data else {},
+            'deltas': deltas
+        }
+    
+    def excel_to_web(self, workers=None, incremental=False, target='json'):
+        """Excel -> 网页同步，返回同步结果字典
+        
+        target 为 'json'（服务器数据文件）或 'html'（内嵌到网页文件）；
+        workers > 1 时并行解析各工作表；incremental=True 时对照增量同步清单，
+        Excel 文件未改动或记录没有变化时跳过写入。
+        """
+        self._log("\n" + "="*50)
+        self._log("开始 Excel -> 网页 同步")
+        self._log("="*50)
+        
+        manifest = self.load_manifest() if incremental else None
+        if manifest and os.path.exists(self.excel_path) and manifest.get('excel') == self._excel_stat():
+            self._log("✓ Excel 文件自上次同步后未改动，无需同步")
+            return self._result('excel_to_web', 'unchanged')
+        
+        excel_stat = self._excel_stat() if os.path.exists(self.excel_path) else None
+        self.backup_excel()
+        data = self.read_excel_data(workers=workers)
+        
+        deltas = None
+        if manifest:
+            deltas = self.compute_deltas(manifest, data)
+            if not deltas:
+                self.save_manifest(data, excel_stat)
+                self._log("\n✓ 记录没有变化，无需同步")
+                return self._result('excel_to_web', 'unchanged', data)
+            self._print_deltas(deltas)
+        
+        if target == 'html':
+            self.write_html_data(data)
+        else:
+            self.write_json_data(data)
+        self.save_manifest(data, excel_stat)
+        self._log("\n✓ Excel -> 网页 同步完成")
+        return self._result('excel_to_web', 'synced', data, deltas)
+    
+    def web_to_excel(self, data=None, incremental=False, source='json'):
+        """网页 -> Excel 同步，返回同步结果字典
+        
+        data 为空时按 source 读取网页数据：'json'（服务器数据文件）或 'html'（网页文件）；
+        incremental=True 且 Excel 自上次同步后未被改动时，只写回有变化的行。
+        """
+        self._log("\n" + "="*50)
+        self._log("开始 网页 -> Excel 同步")
+        self._log("="*50)
+        
+        if data is None:
+            data = self.read_html_data() if source == 'html' else self.read_json_data()
+        
+        manifest = self.load_manifest() if incremental else None
+        if manifest and manifest.get('excel') != self._excel_stat():
+            self._log("⚠ Excel 文件在上次同步后被修改，改为全量导出")
+            manifest = None
+        
+        deltas = None
+        if manifest:
+            deltas = self.compute_deltas(manifest, data)
+            if not deltas:
+                self._log("\n✓ 记录没有变化，无需同步")
+                return self._result('web_to_excel', 'unchanged', data)
+            self._print_deltas(deltas)
+            self.backup_excel()
+            self.export_delta_to_excel(data, deltas)
+        else:
+            self.backup_excel()
+            self.export_to_excel(data)
+        
+        self.save_manifest(data)
+        self._log("\n✓ 网页 -> Excel 同步完成")
+        return self._result('web_to_excel', 'synced', data, deltas)
+
+
+class WorkbookWatcher:
+    """监视 Excel 文件，保存后防抖并在后台线程中执行增量 Excel -> 网页 同步
+    
+    通过轮询工作簿自身的修改时间、大小和 inode 判断变化（仅用标准库，各平台通用），
+    Excel 打开文件时生成的 ~$ 锁文件和保存时的临时文件不会触发同步。
+    文件在 debounce 秒内不再变化且是完整的 xlsx（zip）文件后才开始同步，
+    连续多次保存只同步一次；同步进行中发生的修改会在本次同步结束后再同步一次。
+    """
+    
+    def __init__(self, sync, interval=1.0, debounce=2.0, target='json'):
+        self.sync = sync
+        self.interval = interval
+        self.debounce = debounce
+        self.target = target
+        self.stop_event = threading.Event()
+        self._worker = None
+    
+    def _signature(self):
+        try:
+            stat = os.stat(self.sync.excel_path)
+        except OSError:
+            # Excel 保存时会短暂删除/替换原文件
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    
+    def _sync_once(self):
+        started = datetime.now()
+        try:
+            result = self.sync.excel_to_web(incremental=True, target=self.target)
+            seconds = (datetime.now() - started).total_seconds()
+            if result['status'] == 'synced':
+                print(f"[{started:%H:%M:%S}] ✓ 已同步 ({seconds:.2f}s): {result['counts']}", flush=True)
+            else:
+                print(f"[{started:%H:%M:%S}] ✓ 记录没有变化 ({seconds:.2f}s)", flush=True)
+        except SyncError as e:
+            print(f"[{started:%H:%M:%S}] ✗ 同步失败: {str(e)}", flush=True)
+    
+    def _start_sync(self):
+        self._worker = threading.Thread(target=self._sync_once, daemon=True)
+        self._worker.start()
+    
+    def run(self):
+        """阻塞运行，直到 stop() 被调用或按 Ctrl+C"""
+        # 启动时先做一次增量同步，追上监视开始前的修改
+        last_seen = self._signature()
+        last_changed = 0.0
+        synced = last_seen
+        self._start_sync()
+        
+        while not self.stop_event.wait(self.interval):
+            signature = self._signature()
+            now = time.monotonic()
+            if signature != last_seen:
+                last_seen = signature
+                last_changed = now
+                continue
+            
+            if signature is None or signature == synced:
+                continue
+            if now - last_changed < self.debounce:
+                continue
+            if self._worker and self._worker.is_alive():
+                continue
+            if not zipfile.is_zipfile(self.sync.excel_path):
+                continue
+            
+            synced = signature
+            self._start_sync()
+        
+        if self._worker:
+            self._worker.join()
+    
+    def stop(self):
+        self.stop_event.set()
+
+
+def _copy_template_row(ws_out, row):
+    """把只读工作簿的一行单元格复制为 write-only 单元格（保留值和样式）"""
+    from openpyxl.cell import WriteOnlyCell
+    
+    cells = []
+    for cell in row:
+        if not getattr(cell, 'has_style', False):
+            cells.append(cell.value)
+            continue
+        new_cell = WriteOnlyCell(ws_out, value=cell.value)
+        new_cell.font = copy(cell.font)
+        new_cell.fill = copy(cell.fill)
+        new_cell.border = copy(cell.border)
+        new_cell.alignment = copy(cell.alignment)
+        new_cell.number_format = cell.number_format
+        cells.append(new_cell)
+    return cells
+
+
+def _read_sheet_worker(excel_path, sheet_name, field_map):
+    """进程池任务：在子进程中以只读模式解析单个工作表"""
+    from openpyxl import load_workbook
+    
+    sync = FinanceDataSync(excel_path)
+    wb = load_workbook(excel_path, read_only=True)
+    try:
+        return list(sync._iter_sheet_records(wb[sheet_name], field_map))
+    finally:
+        wb.close()
 
 
 def main():
-    sync = FinanceDataSync()
+    parser = argparse.ArgumentParser(description='家庭财务管理系统 - 数据同步工具')
+    parser.add_argument('--excel', default='家庭财务管理系统.xlsx', help='Excel 文件路径')
+    parser.add_argument('--watch', action='store_true',
+                        help='监视模式：Excel 保存后自动增量同步到服务器数据文件')
+    parser.add_argument('--interval', type=float, default=1.0, help='监视模式的轮询间隔（秒）')
+    parser.add_argument('--debounce', type=float, default=2.0,
+                        help='监视模式的防抖时间：文件稳定多少秒后才同步')
+    args = parser.parse_args()
+    
+    sync = FinanceDataSync(args.excel)
+    
+    if args.watch:
+        sync.quiet = True
+        watcher = WorkbookWatcher(sync, interval=args.interval, debounce=args.debounce)
+        print(f"👀 正在监视 {args.excel}，保存后自动同步到 {sync.data_path} (按 Ctrl+C 停止)")
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            watcher.stop()
+            print("\n✓ 已停止监视")
+        return
     
     print("家庭财务管理系统 - 数据同步工具")
     print("="*50)
-    print("1. Excel -> 网页（将 Excel 数据同步到网页）")
-    print("2. 网页 -> Excel（将网页数据导出回 Excel）")
+    print("1. Excel -> 网页（将 Excel 数据同步到服务器数据文件）")
+    print("2. 网页 -> Excel（将服务器数据导出回 Excel）")
     print("3. 双向同步（先从网页读取，再从 Excel 读取）")
+    print("4. 增量 Excel -> 网页（仅在记录有变化时同步）")
+    print("5. 增量 网页 -> Excel（只写回有变化的行）")
+    print("6. 从备份恢复 Excel")
+    print("7. Excel -> 网页文件（数据内嵌到 HTML，离线打开使用）")
+    print("8. 网页文件 -> Excel（导出 HTML 中内嵌的数据）")
     print("="*50)
     
-    choice = input("请选择同步方向（1/2/3，默认为1）: ").strip() or "1"
+    choice = input("请选择同步方向（1-8，默认为1）: ").strip() or "1"
     
+    try:
+        run_choice(sync, choice)
+    except SyncError as e:
+        print(f"\n✗ 同步失败: {str(e)}")
+        sys.exit(1)
+
+
+def run_choice(sync, choice):
+    """执行菜单选项"""
     if choice == "1":
         sync.excel_to_web()
     elif choice == "2":
@@ -348,6 +1117,23 @@ def main():
     elif choice == "3":
         sync.web_to_excel()
         sync.excel_to_web()
+    elif choice == "4":
+        sync.excel_to_web(incremental=True)
+    elif choice == "5":
+        sync.web_to_excel(incremental=True)
+    elif choice == "6":
+        backups = sync.backup_store.list_backups(source=sync.excel_path)[:10]
+        if not backups:
+            print("✗ 没有可用的备份")
+            return
+        for entry in backups:
+            print(f"  {entry['id']}  {entry['time']}  {entry['size']} 字节")
+        backup_id = input("请输入要恢复的备份编号（默认最近一份）: ").strip() or None
+        sync.restore_excel(backup_id)
+    elif choice == "7":
+        sync.excel_to_web(target='html')
+    elif choice == "8":
+        sync.web_to_excel(source='html')
     else:
         print("无效选择")
 